@@ -0,0 +1,18 @@
+# app/admin.py
+"""
+Autorización de los endpoints de administración (/index/*, /profiles/*).
+
+Un solo token (ADMIN_TOKEN; PROFILE_ADMIN_TOKEN se acepta como alias) enviado en el
+header `X-Admin-Token`. Sin token configurado, todo se rechaza.
+"""
+
+import os, hmac
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or os.getenv("PROFILE_ADMIN_TOKEN") or ""
+ADMIN_HEADER = "x-admin-token"
+
+def is_admin(headers) -> bool:
+    if not ADMIN_TOKEN:
+        return False
+    given = headers.get(ADMIN_HEADER) or ""
+    return hmac.compare_digest(given.encode(), ADMIN_TOKEN.encode())
@@ -0,0 +1,75 @@
+# app/assets.py
+"""
+Entrega de archivos generados por app/build_static.py (static/dist/).
+
+- Elige la variante según Accept (AVIF/WebP para imágenes) y Accept-Encoding (br/gzip).
+- ETag precalculado por variante y 304 con If-None-Match.
+- Cache-Control immutable para nombres con hash; no-cache (revalidar) para index.html.
+"""
+import json
+from pathlib import Path
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response
+
+DIST_DIR = Path("static/dist")
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "public, no-cache"
+
+def load_manifest(dist: Path = DIST_DIR) -> Dict:
+    path = dist / "manifest.json"
+    if not path.exists():
+        return {}
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except Exception as e:
+        print("ASSETS_MANIFEST_ERROR:", repr(e))
+        return {}
+
+def _accepts(header: str, token: str) -> bool:
+    for part in header.lower().split(","):
+        fields = part.strip().split(";")
+        if fields[0].strip() == token:
+            return not any(f.strip().replace(" ", "") in ("q=0", "q=0.0") for f in fields[1:])
+    return False
+
+def _pick(entry: Dict, request: Request) -> tuple[Dict, Optional[str]]:
+    """Devuelve (variante, content-encoding)."""
+    accept = request.headers.get("accept", "")
+    for fmt in ("avif", "webp"):
+        if fmt in entry and _accepts(accept, f"image/{fmt}"):
+            return entry[fmt], None
+    enc = request.headers.get("accept-encoding", "")
+    for coding in ("br", "gzip"):
+        if coding in entry and _accepts(enc, coding):
+            return entry[coding], coding
+    return entry, None
+
+def _not_modified(request: Request, etag: str) -> bool:
+    inm = request.headers.get("if-none-match")
+    if not inm:
+        return False
+    tags = {t.strip().removeprefix("W/") for t in inm.split(",")}
+    return "*" in tags or etag in tags
+
+def asset_response(request: Request, name: str, manifest: Dict, dist: Path = DIST_DIR) -> Optional[Response]:
+    """Respuesta para `name` del manifest, o None si no existe."""
+    entry = (manifest.get("assets") or {}).get(name)
+    if not entry:
+        return None
+    variant, coding = _pick(entry, request)
+    vary = [h for h, keys in (("Accept", ("avif", "webp")), ("Accept-Encoding", ("br", "gzip")))
+            if any(k in entry for k in keys)]
+    headers = {
+        "Cache-Control": _IMMUTABLE if entry.get("immutable") else _REVALIDATE,
+        "ETag": variant["etag"],
+    }
+    if vary:
+        headers["Vary"] = ", ".join(vary)
+    if _not_modified(request, variant["etag"]):
+        return Response(status_code=304, headers=headers)
+    if coding:
+        headers["Content-Encoding"] = coding
+    return FileResponse(dist / variant["file"], media_type=variant["type"], headers=headers)
@@ -0,0 +1,146 @@
+# build_static.py
+"""
+Pipeline de archivos estáticos (se ejecuta en el build del deploy, no por request).
+
+Genera static/dist/ a partir de static/:
+- nombres con hash de contenido (fondo.3f2a1b9c0d.png) para servirlos con
+  Cache-Control immutable;
+- variantes precomprimidas .br / .gz para texto (HTML, CSS, JS, SVG...);
+- variantes .webp / .avif para imágenes PNG/JPEG (solo si pesan menos);
+- index.html con las URLs reescritas a /assets/<nombre con hash>;
+- manifest.json con tipo, ETag y variantes de cada archivo (lo lee app/assets.py).
+
+Uso:
+  python -m app.build_static
+  python -m app.build_static --src static --out static/dist
+"""
+import argparse, gzip, hashlib, json, mimetypes, shutil
+from pathlib import Path
+from typing import Dict
+
+# Compresión brotli y formatos de imagen modernos: opcionales
+try:
+    import brotli
+    HAS_BROTLI = True
+except Exception:
+    HAS_BROTLI = False
+
+try:
+    from PIL import Image, features
+    HAS_PIL = True
+except Exception:
+    HAS_PIL = False
+
+TEXT_TYPES = {"text/html", "text/css", "text/javascript", "application/javascript",
+              "application/json", "image/svg+xml", "text/plain"}
+IMAGE_TYPES = {"image/png", "image/jpeg"}
+
+def _etag(data: bytes) -> str:
+    return '"' + hashlib.sha256(data).hexdigest()[:20] + '"'
+
+def _variant(path: Path, data: bytes, content_type: str) -> Dict:
+    path.write_bytes(data)
+    return {"file": path.name, "type": content_type, "etag": _etag(data), "size": len(data)}
+
+def _compressed(out: Path, name: str, data: bytes, content_type: str) -> Dict:
+    variants: Dict = {}
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < len(data):
+        variants["gzip"] = _variant(out / f"{name}.gz", gz, content_type)
+    if HAS_BROTLI:
+        br = brotli.compress(data, quality=11)
+        if len(br) < len(data):
+            variants["br"] = _variant(out / f"{name}.br", br, content_type)
+    return variants
+
+def _images(out: Path, src: Path, stem: str, size: int) -> Dict:
+    variants: Dict = {}
+    if not HAS_PIL:
+        return variants
+    with Image.open(src) as img:
+        img.load()
+        for fmt, mime, opts in (("webp", "image/webp", {"quality": 80, "method": 6}),
+                                ("avif", "image/avif", {"quality": 60})):
+            if not features.check(fmt):
+                print(f"[WARN] Pillow sin soporte {fmt}; se omite {src.name}.{fmt}")
+                continue
+            path = out / f"{stem}.{fmt}"
+            try:
+                img.save(path, fmt.upper(), **opts)
+            except Exception as e:
+                print(f"[WARN] No se pudo generar {path.name}: {e}")
+                continue
+            data = path.read_bytes()
+            if len(data) < size:
+                variants[fmt] = _variant(path, data, mime)
+            else:
+                path.unlink()
+    return variants
+
+def _check_out(src: Path, out: Path):
+    """`out` se borra entero en cada build: no puede ser ni contener a `src`, ni otra carpeta."""
+    src_r, out_r = src.resolve(), out.resolve()
+    if out_r == src_r or out_r in src_r.parents:
+        raise ValueError(f"--out {out} es o contiene a --src {src}: se borrarían los originales.")
+    if out.exists() and any(out.iterdir()) and not (out / "manifest.json").exists():
+        raise ValueError(f"--out {out} no está vacío y no es un build anterior (falta manifest.json).")
+
+def build(src: Path, out: Path) -> Dict:
+    _check_out(src, out)
+    if out.exists():
+        shutil.rmtree(out)
+    out.mkdir(parents=True)
+    manifest: Dict = {"urls": {}, "assets": {}}
+
+    files = sorted(p for p in src.rglob("*") if p.is_file() and out not in p.parents and p.name != "index.html")
+    for f in files:
+        rel = f.relative_to(src).as_posix()
+        data = f.read_bytes()
+        content_type = mimetypes.guess_type(f.name)[0] or "application/octet-stream"
+        digest = hashlib.sha256(data).hexdigest()[:10]
+        stem = f"{f.stem}.{digest}"
+        name = f"{stem}{f.suffix}"
+        entry = _variant(out / name, data, content_type)
+        entry["immutable"] = True
+        if content_type in TEXT_TYPES:
+            entry.update(_compressed(out, name, data, content_type))
+        if content_type in IMAGE_TYPES:
+            entry.update(_images(out, f, stem, len(data)))
+        manifest["assets"][name] = entry
+        manifest["urls"][f"/static/{rel}"] = f"/assets/{name}"
+
+    index = src / "index.html"
+    if index.exists():
+        html = index.read_text(encoding="utf-8")
+        # Las URLs más largas primero para no reescribir prefijos
+        for old in sorted(manifest["urls"], key=len, reverse=True):
+            html = html.replace(old, manifest["urls"][old])
+        data = html.encode("utf-8")
+        entry = _variant(out / "index.html", data, "text/html; charset=utf-8")
+        entry["immutable"] = False
+        entry.update(_compressed(out, "index.html", data, "text/html; charset=utf-8"))
+        manifest["assets"]["index.html"] = entry
+
+    (out / "manifest.json").write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--src", type=str, default="static")
+    parser.add_argument("--out", type=str, default="static/dist")
+    args = parser.parse_args()
+
+    try:
+        manifest = build(Path(args.src), Path(args.out))
+    except ValueError as e:
+        parser.error(str(e))
+    for name, entry in manifest["assets"].items():
+        extra = ", ".join(f"{k}={entry[k]['size']}" for k in ("br", "gzip", "avif", "webp") if k in entry)
+        print(f"[OK] {name}: {entry['size']} bytes" + (f" ({extra})" if extra else ""))
+    if not HAS_BROTLI:
+        print("[WARN] brotli no está instalado: solo variantes gzip.")
+    if not HAS_PIL:
+        print("[WARN] Pillow no está instalado: sin variantes WebP/AVIF.")
+
+if __name__ == "__main__":
+    main()
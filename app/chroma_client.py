@@ -3,32 +3,186 @@
 Cliente Chroma Cloud (Render)
 Autor: Andrés Gamboa
 Versión: estable con CloudClient (sin host)
+
+Versionado del índice:
+- La ingesta crea una colección nueva `<CHROMA_COLLECTION>__v<fecha>` y, cuando pasa
+  las validaciones, cambia el puntero (metadata de la colección `<CHROMA_COLLECTION>__active`).
+- get_collection() sirve siempre la versión activa desde memoria; en la app la tarea
+  pointer_refresher relee el puntero cada INDEX_POINTER_TTL segundos (fuera del event
+  loop y detrás del breaker de Chroma), así los workers toman la versión nueva sin
+  reiniciar. Si no hay puntero se usa CHROMA_COLLECTION tal cual.
+- Se conservan INDEX_KEEP_VERSIONS versiones anteriores para rollback inmediato.
 """
 
-import os
+import os, json, time, asyncio, threading
 import chromadb
+import httpx
+
+from app.resilience import BREAKERS, guarded
 
 # --- Configuración desde variables de entorno ---
 CHROMA_AUTH = os.getenv("CHROMA_SERVER_AUTH", "").strip()
 CHROMA_TENANT = os.getenv("CHROMA_TENANT", "").strip()
 CHROMA_DATABASE = os.getenv("CHROMA_DATABASE", "").strip()
 CHROMA_COLLECTION = os.getenv("CHROMA_COLLECTION", "ccp_docs").strip()
+INDEX_POINTER_TTL = float(os.getenv("INDEX_POINTER_TTL", "30"))
+INDEX_KEEP_VERSIONS = int(os.getenv("INDEX_KEEP_VERSIONS", "3"))
+# El cliente HTTP de chromadb no tiene timeout: sin esto una llamada colgada ocupa para
+# siempre un hilo del breaker. Por defecto, el timeout del breaker "chroma".
+CHROMA_HTTP_TIMEOUT = float(os.getenv("CHROMA_HTTP_TIMEOUT") or BREAKERS["chroma"].timeout)
 
-def get_collection():
-    """
-    Devuelve la colección Chroma en la nube.
-    Usa CloudClient con tenant y database.
-    """
+POINTER_NAME = f"{CHROMA_COLLECTION}__active"
+
+_lock = threading.Lock()
+_client = None
+_active = {"name": None, "checked": 0.0, "collection": None}
+_background = False  # True cuando la app refresca el puntero en segundo plano
+
+def get_client():
+    """CloudClient compartido por el proceso."""
+    global _client
     if not CHROMA_AUTH:
         raise RuntimeError("❌ Falta CHROMA_SERVER_AUTH (API key de Chroma Cloud).")
     if not CHROMA_TENANT or not CHROMA_DATABASE:
         raise RuntimeError("❌ Faltan CHROMA_TENANT y/o CHROMA_DATABASE.")
+    if _client is None:
+        _client = chromadb.CloudClient(
+            api_key=CHROMA_AUTH,
+            tenant=CHROMA_TENANT,
+            database=CHROMA_DATABASE,
+        )
+        session = getattr(getattr(_client, "_server", None), "_session", None)
+        if isinstance(session, httpx.Client):
+            session.timeout = httpx.Timeout(CHROMA_HTTP_TIMEOUT)
+    return _client
+
+# ---------- Puntero de versión ----------
+def read_pointer() -> dict:
+    """{"active": nombre | None, "history": [activa, anterior, ...], "swapped_at": ...}"""
+    meta = get_client().get_or_create_collection(name=POINTER_NAME).metadata or {}
+    try:
+        history = json.loads(meta.get("history") or "[]")
+    except ValueError:
+        history = []
+    return {"active": meta.get("active"), "history": history, "swapped_at": meta.get("swapped_at")}
+
+def _write_pointer(active: str, history: list):
+    get_client().get_or_create_collection(name=POINTER_NAME).modify(metadata={
+        "active": active,
+        "history": json.dumps(history),
+        "swapped_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+
+def refresh_active() -> str:
+    """
+    Relee el puntero (llamada de red bloqueante) y, si cambió la versión, abre la
+    colección nueva antes de publicarla. En la app se ejecuta fuera del event loop
+    (ver pointer_refresher); el lock solo protege el intercambio del estado.
+    Si el puntero apunta a una colección que no existe se sigue sirviendo la actual:
+    nunca se crea una colección vacía para servirla.
+    """
+    try:
+        name = read_pointer()["active"] or CHROMA_COLLECTION
+    except Exception as e:
+        print("INDEX_POINTER_ERROR:", repr(e))
+        name = _active["name"] or CHROMA_COLLECTION
+    col = _active["collection"] if name == _active["name"] else None
+    if col is None:
+        try:
+            if name == CHROMA_COLLECTION:
+                col = get_client().get_or_create_collection(name=name)  # modo sin versiones
+            else:
+                col = get_client().get_collection(name=name)
+        except Exception as e:
+            if _active["collection"] is None:
+                raise
+            print(f"INDEX_VERSION_MISSING: {name} ({e!r}); se mantiene {_active['name']}")
+            with _lock:
+                _active["checked"] = time.monotonic()
+            return _active["name"]
+    with _lock:
+        if _active["name"] and name != _active["name"]:
+            print(f"INDEX_VERSION_CHANGED: {_active['name']} -> {name}")
+        _active.update(name=name, collection=col, checked=time.monotonic())
+    return name
+
+async def pointer_refresher():
+    """Tarea de fondo de la app: refresca la versión activa cada INDEX_POINTER_TTL segundos."""
+    global _background
+    _background = True
+    while True:
+        # Sin versión cargada (falló el arranque) se reintenta antes
+        await asyncio.sleep(INDEX_POINTER_TTL if _active["collection"] is not None else min(INDEX_POINTER_TTL, 5))
+        try:
+            await guarded("chroma", refresh_active)
+        except Exception as e:
+            print("INDEX_REFRESH_ERROR:", repr(e))
+
+def active_collection_name() -> str:
+    """
+    Nombre de la colección activa. Con pointer_refresher corriendo solo lee el estado
+    en memoria (y falla enseguida si aún no hay versión cargada); sin él (CLI) relee
+    el puntero cuando venció INDEX_POINTER_TTL.
+    """
+    if _background:
+        if _active["name"] is None:
+            raise RuntimeError("Índice no disponible: aún no se pudo leer la versión activa.")
+        return _active["name"]
+    if _active["name"] is None or time.monotonic() - _active["checked"] >= INDEX_POINTER_TTL:
+        return refresh_active()
+    return _active["name"]
+
+def corpus_version() -> str:
+    """Versión del corpus servida; úsala como parte de la clave de cualquier caché."""
+    return active_collection_name()
+
+def reload_active() -> str:
+    return refresh_active()
+
+def get_collection():
+    """
+    Devuelve la colección activa en Chroma Cloud.
+    Usa CloudClient con tenant y database.
+    """
+    active_collection_name()
+    with _lock:
+        return _active["collection"]
+
+# ---------- Versiones (usadas por la ingesta) ----------
+def new_version_name() -> str:
+    return f"{CHROMA_COLLECTION}__v{time.strftime('%Y%m%d%H%M%S')}"
+
+def create_version(name: str):
+    return get_client().create_collection(name=name)
+
+def drop_version(name: str):
+    get_client().delete_collection(name=name)
 
-    client = chromadb.CloudClient(
-        api_key=CHROMA_AUTH,
-        tenant=CHROMA_TENANT,
-        database=CHROMA_DATABASE,
-    )
+def swap_active(name: str, keep: int = INDEX_KEEP_VERSIONS) -> dict:
+    """Activa `name` y borra las versiones más antiguas que las `keep` anteriores."""
+    pointer = read_pointer()
+    # Primera ingesta versionada: la colección servida hasta ahora (legacy) queda para rollback
+    previous = pointer["history"] or [pointer["active"] or CHROMA_COLLECTION]
+    history = [name] + [h for h in previous if h != name]
+    kept, dropped = history[: keep + 1], history[keep + 1:]
+    _write_pointer(name, kept)
+    for old in dropped:
+        if old == CHROMA_COLLECTION:
+            continue  # la colección legacy no se borra: es el respaldo si se pierde el puntero
+        try:
+            drop_version(old)
+        except Exception as e:
+            print(f"[WARN] No se pudo borrar {old}: {e}")
+    reload_active()
+    return {"active": name, "history": kept, "dropped": dropped}
 
-    collection = client.get_or_create_collection(name=CHROMA_COLLECTION)
-    return collection
+def rollback() -> dict:
+    """Vuelve a la versión anterior (la actual queda como siguiente en el historial)."""
+    history = read_pointer()["history"]
+    if len(history) < 2:
+        raise RuntimeError("No hay una versión anterior para hacer rollback.")
+    prev = history[1]
+    history = [prev] + [h for h in history if h != prev]
+    _write_pointer(prev, history)
+    reload_active()
+    return {"active": prev, "history": history}
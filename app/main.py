@@ -1,22 +1,36 @@
 # app/main.py
 from fastapi import FastAPI, Request
-from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse
+from fastapi.responses import PlainTextResponse, JSONResponse, FileResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 import os, json, httpx, asyncio
 import chromadb
 
-from app.rag import answer_with_rag
-from app.chroma_client import get_collection
+from app.rag import answer_with_rag, answer_batch
+from app.chroma_client import (
+    get_collection, read_pointer, reload_active, rollback, corpus_version, refresh_active, pointer_refresher,
+)
+from app.traffic import get_recorder, QueueStats, REPLAY_PREFIX
+from app.resilience import breaker_states
+from app.assets import load_manifest, asset_response
+from app.profiling import Profile, start_profile, arm, list_profiles, PROFILE_DIR
+from app.admin import is_admin
 
 app = FastAPI()
 
-# Archivos estáticos
+# Archivos estáticos (originales); las versiones optimizadas las genera app.build_static
 app.mount("/static", StaticFiles(directory="static"), name="static")
+ASSETS = load_manifest()
 
 # Página principal
 @app.get("/")
-async def root():
-    return FileResponse("static/index.html")
+async def root(request: Request):
+    resp = asset_response(request, "index.html", ASSETS)
+    return resp or FileResponse("static/index.html")
+
+@app.get("/assets/{name}")
+async def assets(request: Request, name: str):
+    resp = asset_response(request, name, ASSETS)
+    return resp or PlainTextResponse("not found", status_code=404)
 
 # Variables WhatsApp
 WA_TOKEN = os.getenv("WA_ACCESS_TOKEN") or os.getenv("ACCESS_TOKEN") or ""
@@ -24,6 +38,30 @@ WA_PHONE_ID = os.getenv("WA_PHONE_NUMBER_ID") or os.getenv("PHONE_NUMBER_ID") or
 WA_API_VER = os.getenv("WA_API_VERSION") or os.getenv("VERSION") or "v21.0"
 VERIFY_TOKEN = os.getenv("WA_VERIFY_TOKEN") or os.getenv("VERIFY_TOKEN") or "verify_me"
 
+# Lote de preguntas (/ask/batch)
+ASK_BATCH_MAX = int(os.getenv("ASK_BATCH_MAX", "200"))
+ASK_BATCH_CONCURRENCY = int(os.getenv("ASK_BATCH_CONCURRENCY", "4"))
+ASK_BATCH_MAX_K = 20
+
+# Grabación de tráfico (opcional, WEBHOOK_RECORD_DIR) y métricas de la cola de respuestas
+RECORDER = get_recorder()
+QUEUE = QueueStats()
+
+@app.on_event("startup")
+async def _start_index_refresher():
+    # Resuelve la versión activa antes de atender requests y luego la refresca en segundo plano
+    try:
+        await asyncio.to_thread(refresh_active)
+    except Exception as e:
+        print("INDEX_REFRESH_ERROR:", repr(e))
+    app.state.index_refresher = asyncio.create_task(pointer_refresher())
+    await asyncio.sleep(0)  # la tarea arranca y marca el modo en segundo plano antes del primer request
+
+@app.on_event("shutdown")
+def _flush_recorder():
+    if RECORDER:
+        RECORDER.close()
+
 # ---------- Utilidad: enviar texto por WhatsApp ----------
 async def send_whatsapp_text(to_number: str, body: str):
     url = f"https://graph.facebook.com/{WA_API_VER}/{WA_PHONE_ID}/messages"
@@ -47,7 +85,16 @@ async def send_whatsapp_text(to_number: str, body: str):
 # ---------- Salud ----------
 @app.get("/healthz")
 def healthz():
-    return {"ok": True, "servicio": "CCP WhatsApp RAG", "webhook": "/webhook"}
+    return {
+        "ok": True,
+        "servicio": "CCP WhatsApp RAG",
+        "webhook": "/webhook",
+        "breakers": {name: b["state"] for name, b in breaker_states().items()},
+    }
+
+@app.get("/breakers")
+def breakers():
+    return breaker_states()
 
 @app.get("/env-check")
 def env_check():
@@ -67,34 +114,68 @@ async def verify(request: Request):
     return PlainTextResponse("forbidden", status_code=403)
 
 # ---------- Webhook POST (mensajes) ----------
+def parse_webhook(body: dict) -> tuple[str, str] | None:
+    """Devuelve (remitente, texto) del primer mensaje del evento, o None si no trae mensajes."""
+    changes = body["entry"][0]["changes"][0]["value"]
+    msgs = changes.get("messages", [])
+    if not msgs:
+        return None
+    msg = msgs[0]
+    return msg["from"], msg.get("text", {}).get("body", "").strip()
+
 @app.post("/webhook")
 async def receive(request: Request):
-    body = await request.json()
-    print("WEBHOOK EVENT:", json.dumps(body, ensure_ascii=False))
+    prof = start_profile("webhook", request.headers)
     try:
-        changes = body["entry"][0]["changes"][0]["value"]
-        msgs = changes.get("messages", [])
-        if not msgs:
-            return {"status": "ok"}
-        msg = msgs[0]
-        from_waid = msg["from"]
-        user_text = msg.get("text", {}).get("body", "").strip()
-        asyncio.create_task(process_and_reply(from_waid, user_text))
-    except Exception as e:
-        print("ERROR_PROCESSING_EVENT:", repr(e))
-    return {"status": "ok"}
+        body = await request.json()
+        if RECORDER:
+            RECORDER.record(body)
+        print("WEBHOOK EVENT:", json.dumps(body, ensure_ascii=False))
+        try:
+            parsed = parse_webhook(body)
+            if not parsed:
+                return {"status": "ok"}
+            from_waid, user_text = parsed
+            asyncio.create_task(process_and_reply(from_waid, user_text, prof))
+            prof = None  # lo cierra la tarea en segundo plano
+        except Exception as e:
+            print("ERROR_PROCESSING_EVENT:", repr(e))
+        return {"status": "ok"}
+    finally:
+        if prof:
+            await asyncio.to_thread(prof.stop)  # join del muestreador y escritura fuera del loop
 
-async def process_and_reply(to_waid: str, user_text: str):
+async def process_and_reply(to_waid: str, user_text: str, prof: Profile | None = None):
+    t0 = QUEUE.start()
+    ok = True
     try:
         answer = await answer_with_rag(user_text)
         final_text = answer or "No tengo esa información exacta; te recomiendo verificarla con un asesor de la Cámara."
-        await send_whatsapp_text(to_waid, final_text)
+        if to_waid.startswith(REPLAY_PREFIX):
+            print("REPLAY_ANSWER:", to_waid, len(final_text))
+        else:
+            await send_whatsapp_text(to_waid, final_text)
     except Exception as e:
+        ok = False
         print("ERROR_BG_TASK:", repr(e))
-        await send_whatsapp_text(
-            to_waid,
-            "Hubo un error procesando tu consulta. Intenta de nuevo o contacta a un asesor.",
-        )
+        if not to_waid.startswith(REPLAY_PREFIX):
+            await send_whatsapp_text(
+                to_waid,
+                "Hubo un error procesando tu consulta. Intenta de nuevo o contacta a un asesor.",
+            )
+    finally:
+        QUEUE.done(t0, ok)
+        if prof:
+            await asyncio.to_thread(prof.stop)
+
+# ---------- Métricas de la cola (usadas por app.replay_webhook) ----------
+@app.get("/traffic-stats")
+def traffic_stats(reset_peak: bool = False):
+    snap = QUEUE.snapshot()
+    if reset_peak:
+        QUEUE.reset_peak()
+    snap["recording"] = bool(RECORDER)
+    return snap
 
 # ---------- Envío manual de plantilla ----------
 @app.get("/send-test")
@@ -137,9 +218,40 @@ def chroma_check():
                 count = len(peek.get("ids", []))
             except Exception:
                 count = None
-        return {"ok": True, "collection": col.name, "count": count}
+        return {"ok": True, "collection": col.name, "count": count, "breaker": breaker_states()["chroma"]}
     except Exception as e:
-        return {"ok": False, "error": repr(e)}
+        return {"ok": False, "error": repr(e), "breaker": breaker_states()["chroma"]}
+
+# ---------- Versión del índice ----------
+@app.get("/index")
+def index_info():
+    try:
+        serving = corpus_version()
+    except Exception as e:
+        serving = {"error": repr(e)}
+    try:
+        pointer = read_pointer()
+    except Exception as e:
+        pointer = {"error": repr(e)}
+    return {"serving": serving, "pointer": pointer, "breaker": breaker_states()["chroma"]}
+
+@app.post("/index/reload")
+def index_reload(request: Request):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    try:
+        return {"serving": reload_active()}
+    except Exception as e:
+        return JSONResponse({"error": repr(e)}, status_code=502)
+
+@app.post("/index/rollback")
+def index_rollback(request: Request):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    try:
+        return rollback()
+    except Exception as e:
+        return JSONResponse({"error": repr(e)}, status_code=409)
 
 @app.get("/chroma-version")
 def chroma_version():
@@ -167,10 +279,70 @@ def chroma_debug():
 
 # ---------- Probar RAG desde navegador ----------
 @app.get("/ask")
-async def ask(q: str):
-    ans = await answer_with_rag(q)
+async def ask(request: Request, q: str):
+    prof = start_profile("ask", request.headers)
+    try:
+        ans = await answer_with_rag(q)
+    finally:
+        if prof:
+            await asyncio.to_thread(prof.stop)
     return {"query": q, "answer": ans}
 
+@app.post("/ask/batch")
+async def ask_batch(request: Request):
+    """
+    Body: {"questions": ["...", ...], "k": 5, "concurrency": 4} o directamente una lista.
+    Responde NDJSON: una línea por pregunta, en el orden en que se completan.
+    """
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "JSON inválido."}, status_code=400)
+    if isinstance(body, list):
+        body = {"questions": body}
+    questions = body.get("questions") if isinstance(body, dict) else None
+    if not isinstance(questions, list) or not questions or not all(isinstance(q, str) for q in questions):
+        return JSONResponse({"error": "Se espera 'questions': lista no vacía de textos."}, status_code=400)
+    if len(questions) > ASK_BATCH_MAX:
+        return JSONResponse({"error": f"Máximo {ASK_BATCH_MAX} preguntas por lote."}, status_code=413)
+    try:
+        k = int(body.get("k") or 5)
+        concurrency = int(body.get("concurrency") or ASK_BATCH_CONCURRENCY)
+    except (TypeError, ValueError):
+        return JSONResponse({"error": "'k' y 'concurrency' deben ser enteros."}, status_code=400)
+    if concurrency < 1:
+        return JSONResponse({"error": "'concurrency' debe ser >= 1."}, status_code=400)
+    k = max(1, min(k, ASK_BATCH_MAX_K))
+    concurrency = min(concurrency, ASK_BATCH_CONCURRENCY)
+
+    async def _ndjson():
+        async for item in answer_batch(questions, k=k, concurrency=concurrency):
+            yield json.dumps(item, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+# ---------- Perfilado (requiere header X-Admin-Token) ----------
+@app.get("/profiles")
+def profiles(request: Request):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    return {"dir": str(PROFILE_DIR), "profiles": list_profiles()}
+
+@app.post("/profiles/arm")
+def profiles_arm(request: Request, n: int = 1):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    return {"armed": arm(n)}
+
+@app.get("/profiles/{name}")
+def profile_file(request: Request, name: str):
+    if not is_admin(request.headers):
+        return JSONResponse({"error": "forbidden"}, status_code=403)
+    path = PROFILE_DIR / name
+    if "/" in name or name.startswith(".") or not path.is_file():
+        return JSONResponse({"error": "not found"}, status_code=404)
+    return FileResponse(path)
+
 @app.get("/chroma-echo")
 def chroma_echo():
     import os, chromadb
@@ -0,0 +1,182 @@
+# app/profiling.py
+"""
+Perfilado por muestreo, opcional y por request.
+
+Un hilo muestreador toma cada PROFILE_INTERVAL_MS las pilas de todos los hilos del
+proceso (event loop y hilos de asyncio.to_thread / executor) con sys._current_frames:
+- perfil "wall": cada muestra pesa el intervalo;
+- perfil "cpu": cada muestra pesa el tiempo de CPU que consumió ese hilo (Linux).
+Al terminar escribe en PROFILE_DIR un .speedscope.json (https://www.speedscope.app)
+y archivos .collapsed (formato de flamegraph.pl).
+
+Se activa para una fracción de requests (PROFILE_SAMPLE_RATE, p. ej. 0.01), para un
+request con los headers `X-Profile: 1` y `X-Admin-Token: <ADMIN_TOKEN>`, o para los próximos N
+requests con POST /profiles/arm. Desactivado, el costo es una lectura de header.
+Nota: se muestrea todo el proceso, así que requests concurrentes aparecen mezclados.
+"""
+
+import os, sys, json, time, random, threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.admin import is_admin
+
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", ".profiles"))
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5") or 5)
+PROFILE_MAX_FILES = int(os.getenv("PROFILE_MAX_FILES", "200"))
+
+_armed = 0
+_armed_lock = threading.Lock()
+
+Frame = Tuple[str, str, int]
+
+def _thread_cpu(ident: int) -> Optional[float]:
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(ident))
+    except Exception:
+        return None
+
+class Sampler(threading.Thread):
+    def __init__(self, interval: float):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.interval = interval
+        self.wall: Dict[str, Counter] = {}
+        self.cpu: Dict[str, Counter] = {}
+        self._cpu_last: Dict[int, float] = {}
+        self._halt = threading.Event()
+        self.samples = 0
+
+    def run(self):
+        me = threading.get_ident()
+        while not self._halt.wait(self.interval):
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                stack: List[Frame] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append((code.co_name, code.co_filename, code.co_firstlineno))
+                    frame = frame.f_back
+                stack.reverse()
+                key = tuple(stack)
+                tname = names.get(ident, str(ident))
+                self.wall.setdefault(tname, Counter())[key] += self.interval * 1000
+                now = _thread_cpu(ident)
+                if now is not None:
+                    delta = now - self._cpu_last.get(ident, now)
+                    self._cpu_last[ident] = now
+                    if delta > 0:
+                        self.cpu.setdefault(tname, Counter())[key] += delta * 1000
+            self.samples += 1
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+class Profile:
+    """Un perfil en curso; `stop()` escribe los archivos y devuelve el nombre base."""
+
+    def __init__(self, label: str):
+        self.label = "".join(c if c.isalnum() or c in "-_" else "_" for c in label)[:40]
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+        self._sampler = Sampler(PROFILE_INTERVAL_MS / 1000)
+        self._sampler.start()
+
+    def stop(self) -> Optional[str]:
+        self._sampler.stop()
+        elapsed_ms = (time.perf_counter() - self._t0) * 1000
+        try:
+            return _write(self.label, self.started, elapsed_ms, self._sampler)
+        except Exception as e:
+            print("PROFILE_WRITE_ERROR:", repr(e))
+            return None
+
+def _frame_name(f: Frame) -> str:
+    name, filename, line = f
+    return f"{name} ({Path(filename).name}:{line})"
+
+def _write(label: str, started: float, elapsed_ms: float, s: Sampler) -> str:
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    base = time.strftime("%Y%m%d-%H%M%S", time.localtime(started)) + f"-{int(started * 1000) % 1000:03d}-{label}"
+
+    frames: List[Dict] = []
+    index: Dict[Frame, int] = {}
+
+    def fid(f: Frame) -> int:
+        if f not in index:
+            index[f] = len(frames)
+            frames.append({"name": _frame_name(f), "file": f[1], "line": f[2]})
+        return index[f]
+
+    profiles = []
+    for mode, data in (("wall", s.wall), ("cpu", s.cpu)):
+        lines = []
+        for tname, stacks in sorted(data.items()):
+            samples, weights = [], []
+            for stack, weight in stacks.items():
+                samples.append([fid(f) for f in stack])
+                weights.append(round(weight, 3))
+                lines.append(";".join([tname] + [_frame_name(f) for f in stack]) + f" {max(1, round(weight))}")
+            total = round(sum(weights), 3)
+            profiles.append({"type": "sampled", "name": f"{mode} · {tname}", "unit": "milliseconds",
+                             "startValue": 0, "endValue": total, "samples": samples, "weights": weights})
+        (PROFILE_DIR / f"{base}.{mode}.collapsed").write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+    doc = {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": f"{label} ({elapsed_ms:.0f} ms, {s.samples} muestras)",
+        "exporter": "ccp-profiling",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": profiles,
+    }
+    (PROFILE_DIR / f"{base}.speedscope.json").write_text(json.dumps(doc), encoding="utf-8")
+    _prune()
+    print(f"PROFILE_SAVED: {base} ({elapsed_ms:.0f} ms, {s.samples} muestras)")
+    return base
+
+def _prune():
+    files = sorted(PROFILE_DIR.glob("*.speedscope.json"), key=lambda p: p.stat().st_mtime)
+    for old in files[:-PROFILE_MAX_FILES] if PROFILE_MAX_FILES > 0 else []:
+        base = old.name.removesuffix(".speedscope.json")
+        for f in PROFILE_DIR.glob(f"{base}.*"):
+            f.unlink(missing_ok=True)
+
+def arm(n: int) -> int:
+    global _armed
+    with _armed_lock:
+        _armed = max(0, n)
+        return _armed
+
+def start_profile(label: str, headers) -> Optional[Profile]:
+    """Inicia un perfil si este request fue elegido; si no, devuelve None."""
+    global _armed
+    chosen = False
+    if _armed:
+        with _armed_lock:
+            if _armed > 0:
+                _armed -= 1
+                chosen = True
+    if not chosen and "x-profile" in headers:
+        chosen = is_admin(headers)
+    if not chosen and PROFILE_SAMPLE_RATE > 0:
+        chosen = random.random() < PROFILE_SAMPLE_RATE
+    return Profile(label) if chosen else None
+
+def list_profiles() -> List[Dict]:
+    if not PROFILE_DIR.exists():
+        return []
+    out = []
+    for f in sorted(PROFILE_DIR.glob("*.speedscope.json"), key=lambda p: p.stat().st_mtime, reverse=True):
+        base = f.name.removesuffix(".speedscope.json")
+        out.append({
+            "id": base,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(f.stat().st_mtime)),
+            "files": sorted(p.name for p in PROFILE_DIR.glob(f"{base}.*")),
+            "bytes": sum(p.stat().st_size for p in PROFILE_DIR.glob(f"{base}.*")),
+        })
+    return out
@@ -5,9 +5,10 @@ Busca información en Chroma Cloud (modo HTTP simple) y genera respuestas
 usando el modelo Gemma de Groq.
 """
 
-import os, asyncio, requests
-from typing import List, Union
+import os, re, time, asyncio, requests
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
 from app.chroma_client import get_collection  # cliente HTTP simple (sin tenant)
+from app.resilience import BREAKERS, guarded
 from groq import Groq
 
 # ================== POLÍTICAS / PROMPT DEL ASISTENTE ==================
@@ -43,46 +44,153 @@ _HF_HEADERS = {"Authorization": f"Bearer {HF_API_TOKEN}"} if HF_API_TOKEN else {
 # LLM (Groq / Gemma)
 GROQ_API_KEY = os.getenv("GROQ_API_KEY", "")
 GROQ_MODEL = os.getenv("GROQ_MODEL", "gemma2-9b-it")
-_llm = Groq(api_key=GROQ_API_KEY) if GROQ_API_KEY else None
+# Timeout del breaker y sin reintentos del SDK (60 s × 3 por defecto): si no, una llamada
+# abandonada por el breaker sigue ocupando un hilo de su pool por minutos.
+_llm = Groq(api_key=GROQ_API_KEY, timeout=BREAKERS["groq"].timeout, max_retries=0) if GROQ_API_KEY else None
 
 # ================== EMBEDDINGS (Hugging Face) ==================
-def hf_embed(texts: Union[str, List[str]]) -> List[List[float]]:
-    """Obtiene embeddings usando la API de Hugging Face."""
+def _mean_pool(v):
+    """
+    Promedia la salida de HF sobre los tokens: [dim] o [seq, dim] → [dim];
+    [[seq, dim], ...] → un vector [dim] por texto (no se mezclan textos).
+    """
+    if not v:
+        return []
+    if isinstance(v[0], (int, float)):
+        return v
+    if isinstance(v[0], list) and isinstance(v[0][0], (int, float)):
+        seq, dim = len(v), len(v[0])
+        return [sum(v[t][d] for t in range(seq)) / seq for d in range(dim)]
+    if isinstance(v[0], list) and isinstance(v[0][0], list):
+        return [_mean_pool(x) for x in v]
+    raise RuntimeError("Formato inesperado en embeddings.")
+
+def hf_embed(texts: Union[str, List[str]], timeout: float = 120, wait_for_model: bool = True) -> List[List[float]]:
+    """
+    Obtiene embeddings usando la API de Hugging Face.
+    Detrás de un breaker se llama con su timeout y sin wait_for_model: con el modelo
+    en frío HF responde 503 enseguida en vez de bloquear el hilo hasta que cargue.
+    """
     if not HF_API_TOKEN:
         raise RuntimeError("Falta la variable HF_API_TOKEN en el entorno.")
 
-    if isinstance(texts, str):
-        payload = {"inputs": [texts], "options": {"wait_for_model": True}}
-    else:
-        payload = {"inputs": texts, "options": {"wait_for_model": True}}
+    inputs = [texts] if isinstance(texts, str) else list(texts)
+    payload = {"inputs": inputs, "options": {"wait_for_model": wait_for_model}}
 
-    r = requests.post(_HF_URL, headers=_HF_HEADERS, json=payload, timeout=120)
+    r = requests.post(_HF_URL, headers=_HF_HEADERS, json=payload, timeout=timeout)
     r.raise_for_status()
     data = r.json()
 
-    def mean_pool(v):
-        if not v:
-            return []
-        if isinstance(v[0], (int, float)):
-            return v
-        if isinstance(v[0], list) and isinstance(v[0][0], (int, float)):
-            seq, dim = len(v), len(v[0])
-            return [sum(v[t][d] for t in range(seq)) / seq for d in range(dim)]
-        if isinstance(v[0], list) and isinstance(v[0][0], list):
-            return [mean_pool(x) for x in v]
+    if not isinstance(data, list) or not data:
         raise RuntimeError("Formato inesperado en embeddings.")
-    pooled = mean_pool(data)
-    return [pooled] if isinstance(pooled[0], (int, float)) else pooled
+    if isinstance(data[0], list) and data[0] and isinstance(data[0][0], list):
+        vecs = _mean_pool(data)           # [[seq, dim], ...]: uno por texto
+    elif len(inputs) > 1:
+        vecs = data                       # [[dim], ...]
+    else:
+        vecs = [_mean_pool(data)]         # [dim] o [seq, dim] de un solo texto
+    if len(vecs) != len(inputs) or not all(vecs) or not all(isinstance(x, (int, float)) for x in vecs[0]):
+        raise RuntimeError(f"HF devolvió {len(vecs)} embeddings para {len(inputs)} textos.")
+    return vecs
 
 # ================== BÚSQUEDA EN CHROMA ==================
+async def _guarded_embed(breaker: str, texts: Union[str, List[str]], hedge: bool = False,
+                         wait_for_model: bool = False) -> List[List[float]]:
+    """hf_embed con el breaker `breaker`; el timeout HTTP es el del breaker para no dejar hilos colgados."""
+    return await guarded(
+        breaker, hf_embed, texts, hedge=hedge, timeout=BREAKERS[breaker].timeout, wait_for_model=wait_for_model
+    )
+
 async def _search_chunks(query: str, k: int = 5) -> List[str]:
-    """Busca fragmentos relevantes en Chroma Cloud."""
+    """Busca fragmentos relevantes en Chroma Cloud (léxica si los embeddings no están disponibles)."""
     col = get_collection()
-    qvec = hf_embed(query)[0]
-    res = col.query(query_embeddings=[qvec], n_results=k, include=["documents"])
+    try:
+        qvec = (await _guarded_embed("hf_embed", query, hedge=True))[0]
+    except Exception as e:
+        print("RAG_DEGRADED: embeddings no disponibles, búsqueda léxica:", repr(e))
+        return await _lexical_search(col, query, k)
+    res = await guarded(
+        "chroma", col.query, query_embeddings=[qvec], n_results=k, include=["documents"], hedge=True
+    )
     docs = (res.get("documents") or [[]])[0]
     return [d for d in docs if d]
 
+BATCH_SEARCH_SIZE = int(os.getenv("BATCH_SEARCH_SIZE", "32"))
+
+async def _search_chunks_batch(queries: List[str], k: int = 5) -> Tuple[List[List[str]], List[bool]]:
+    """
+    Busca fragmentos para varias preguntas con embeddings y consultas a Chroma en lote.
+    Usa breakers propios (hf_embed_batch / chroma_batch), sin hedging y en lotes de
+    BATCH_SEARCH_SIZE, para que las corridas masivas no abran los breakers del tráfico en vivo.
+    Aquí sí se espera a que HF cargue el modelo (el breaker de lotes da 60 s).
+    Devuelve los fragmentos y, por pregunta, si se usó la búsqueda léxica.
+    """
+    if not queries:
+        return [], []
+    col = get_collection()
+    out: List[List[str]] = []
+    lexical: List[bool] = []
+    for start in range(0, len(queries), BATCH_SEARCH_SIZE):
+        part = queries[start:start + BATCH_SEARCH_SIZE]
+        try:
+            qvecs = await _guarded_embed("hf_embed_batch", part, wait_for_model=True)
+        except Exception as e:
+            print("RAG_DEGRADED: embeddings no disponibles, búsqueda léxica:", repr(e))
+            out.extend(await asyncio.gather(*[_lexical_search(col, q, k, breaker="chroma_batch") for q in part]))
+            lexical.extend([True] * len(part))
+            continue
+        res = await guarded(
+            "chroma_batch", col.query, query_embeddings=qvecs, n_results=k, include=["documents"]
+        )
+        docs = res.get("documents") or []
+        out.extend([[d for d in (docs[i] if i < len(docs) else []) if d] for i in range(len(part))])
+        lexical.extend([False] * len(part))
+    return out, lexical
+
+# ================== RUTA DEGRADADA ==================
+_STOPWORDS = {
+    "para", "como", "cual", "cuál", "cuales", "donde", "dónde", "cuando", "cuándo", "quiero",
+    "necesito", "puedo", "tiene", "tienen", "sobre", "este", "esta", "esto", "están", "hola",
+    "gracias", "favor", "información", "camara", "cámara", "comercio", "pamplona",
+}
+
+def _keywords(query: str, limit: int = 3) -> List[str]:
+    words = [w for w in re.findall(r"\w{4,}", query.lower()) if w not in _STOPWORDS]
+    return sorted(dict.fromkeys(words), key=len, reverse=True)[:limit]
+
+async def _lexical_search(col, query: str, k: int = 5, breaker: str = "chroma") -> List[str]:
+    """Búsqueda por palabras clave en Chroma (sin embeddings); ordena por términos coincidentes."""
+    terms = _keywords(query)
+    if not terms:
+        return []
+    results = await asyncio.gather(
+        *[guarded(breaker, col.get, where_document={"$contains": t}, limit=k * 4, include=["documents"])
+          for t in terms],
+        return_exceptions=True,
+    )
+    found: Dict[str, int] = {}
+    for res in results:
+        if isinstance(res, Exception):
+            print("RAG_LEXICAL_ERROR:", repr(res))
+            continue
+        for d in res.get("documents") or []:
+            if d and d not in found:
+                low = d.lower()
+                found[d] = sum(low.count(t) for t in terms)
+    return sorted(found, key=found.get, reverse=True)[:k]
+
+def _degraded_answer(docs: List[str], max_chars: int = 600) -> str:
+    """Respuesta extractiva cuando el LLM no está disponible."""
+    text = docs[0].strip()
+    if len(text) > max_chars:
+        cut = text[:max_chars]
+        text = cut[: cut.rfind(". ") + 1] if ". " in cut else cut + "…"
+    return (
+        "En este momento no puedo generar una respuesta completa. "
+        "Esto es lo que encontré en la información de la Cámara:\n\n"
+        f"{text}\n\nSi necesitas más detalle, contacta a un asesor."
+    )
+
 # ================== PROMPT Y LLAMADA AL LLM ==================
 def _build_prompt(question: str, context_docs: List[str]) -> str:
     context = "\n\n".join(context_docs[:5]) or "No hay contexto disponible."
@@ -112,7 +220,7 @@ async def _call_llm(prompt: str) -> str:
             max_tokens=700,
         )
         return completion.choices[0].message.content.strip()
-    return await asyncio.to_thread(_sync_call)
+    return await guarded("groq", _sync_call)
 
 # ================== ORQUESTACIÓN ==================
 async def answer_with_rag(question: str) -> str:
@@ -122,7 +230,94 @@ async def answer_with_rag(question: str) -> str:
         if not docs:
             return "No tengo esa información exacta; te recomiendo verificarla con un asesor de la Cámara."
         prompt = _build_prompt(question, docs)
-        return await _call_llm(prompt)
+        try:
+            return await _call_llm(prompt)
+        except Exception as e:
+            print("RAG_DEGRADED: LLM no disponible:", repr(e))
+            return _degraded_answer(docs)
     except Exception as e:
         print("RAG_ERROR:", repr(e))
         return "Hubo un inconveniente procesando tu consulta. Intenta de nuevo o contacta a un asesor."
+
+async def answer_batch(questions: List[str], k: int = 5, concurrency: int = 4) -> AsyncIterator[Dict]:
+    """
+    Responde varias preguntas compartiendo el trabajo de embeddings y búsqueda.
+    Deduplica preguntas y prompts idénticos, limita las llamadas concurrentes al LLM
+    y entrega cada resultado apenas termina (no en el orden de entrada).
+    Cada resultado trae "degraded": "search" (búsqueda léxica o fallida), "llm"
+    (respuesta sin LLM) o None, para separar las respuestas degradadas en las regresiones.
+    """
+    t0 = time.perf_counter()
+    norm = [(q or "").strip() for q in questions]
+    unique_qs = list(dict.fromkeys(q for q in norm if q))
+
+    # 1) Embeddings + búsqueda vectorizada para todas las preguntas únicas
+    try:
+        found, lexical = await _search_chunks_batch(unique_qs, k=k)
+        docs_by_q = dict(zip(unique_qs, found))
+        lexical_qs = {q for q, lex in zip(unique_qs, lexical) if lex}
+        search_error = None
+    except Exception as e:
+        print("RAG_BATCH_SEARCH_ERROR:", repr(e))
+        docs_by_q, lexical_qs, search_error = {}, set(), e
+    search_ms = round((time.perf_counter() - t0) * 1000, 1)
+
+    # 2) Agrupa índices por prompt para llamar al LLM una sola vez por prompt
+    by_prompt: Dict[str, List[int]] = {}
+    prompt_docs: Dict[str, List[str]] = {}
+    fixed: Dict[int, Tuple[str, Optional[str]]] = {}
+    for i, q in enumerate(norm):
+        if search_error is not None:
+            fixed[i] = ("Hubo un inconveniente procesando tu consulta. Intenta de nuevo o contacta a un asesor.",
+                        "search")
+            continue
+        docs = docs_by_q.get(q)
+        if not docs:
+            fixed[i] = ("No tengo esa información exacta; te recomiendo verificarla con un asesor de la Cámara.",
+                        "search" if q in lexical_qs else None)
+            continue
+        prompt = _build_prompt(q, docs)
+        by_prompt.setdefault(prompt, []).append(i)
+        prompt_docs[prompt] = docs
+
+    def _item(i: int, answer: str, degraded: Optional[str], llm_ms: float, shared: int) -> Dict:
+        return {
+            "index": i,
+            "query": questions[i],
+            "answer": answer,
+            "degraded": degraded or ("search" if norm[i] in lexical_qs else None),
+            "shared_with": shared,
+            "timings_ms": {
+                "search": search_ms,
+                "llm": llm_ms,
+                "total": round((time.perf_counter() - t0) * 1000, 1),
+            },
+        }
+
+    for i, (answer, degraded) in fixed.items():
+        yield _item(i, answer, degraded, 0.0, 0)
+
+    # 3) LLM con concurrencia acotada
+    sem = asyncio.Semaphore(max(1, concurrency))
+
+    async def _run(prompt: str):
+        async with sem:
+            t1 = time.perf_counter()
+            degraded = None if _llm else "llm"  # sin GROQ_API_KEY _call_llm responde un texto fijo
+            try:
+                answer = await _call_llm(prompt)
+            except Exception as e:
+                print("RAG_DEGRADED: LLM no disponible:", repr(e))
+                answer, degraded = _degraded_answer(prompt_docs[prompt]), "llm"
+            return prompt, answer, degraded, round((time.perf_counter() - t1) * 1000, 1)
+
+    tasks = [asyncio.create_task(_run(p)) for p in by_prompt]
+    try:
+        for fut in asyncio.as_completed(tasks):
+            prompt, answer, degraded, llm_ms = await fut
+            idxs = by_prompt[prompt]
+            for i in idxs:
+                yield _item(i, answer, degraded, llm_ms, len(idxs) - 1)
+    finally:
+        for t in tasks:
+            t.cancel()
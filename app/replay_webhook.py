@@ -0,0 +1,152 @@
+# replay_webhook.py
+"""
+Repite una grabación de /webhook (ver app/traffic.py) contra una app en ejecución,
+respetando la forma temporal del tráfico real.
+
+Uso:
+  python -m app.replay_webhook grabaciones/webhook-*.jsonl.gz --url http://localhost:8080 --speed 1
+  python -m app.replay_webhook grabaciones/ --speed 10
+  python -m app.replay_webhook grabaciones/ --speed max --concurrency 64
+
+Los números de la grabación llevan el prefijo de repetición, así que la app
+procesa el RAG completo pero no envía nada a WhatsApp.
+"""
+import argparse, asyncio, time
+from pathlib import Path
+from typing import Dict, List
+
+import httpx
+
+from app.traffic import read_recording
+
+def collect_events(paths: List[str]) -> List[Dict]:
+    files: List[Path] = []
+    for p in map(Path, paths):
+        files.extend(sorted(p.glob("*.jsonl.gz")) if p.is_dir() else [p])
+    events: List[Dict] = []
+    for f in files:
+        events.extend(read_recording(f))
+    events.sort(key=lambda e: e["ts"])
+    return events
+
+def _speed(value: str) -> float | None:
+    """'max' (sin pausas, None) o un factor de tiempo positivo."""
+    if value.strip().lower() == "max":
+        return None
+    try:
+        speed = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"velocidad inválida: {value!r} (usa un número > 0 o 'max')")
+    if not speed > 0 or speed == float("inf"):
+        raise argparse.ArgumentTypeError(f"la velocidad debe ser > 0 (o 'max'), no {value}")
+    return speed
+
+def _pct(values: List[float], p: float):
+    v = sorted(values)
+    return round(v[min(len(v) - 1, int(p * len(v)))], 1) if v else None
+
+async def _poll_stats(client: httpx.AsyncClient, url: str, samples: List[Dict], stop: asyncio.Event, every: float):
+    t0 = time.perf_counter()
+    while not stop.is_set():
+        try:
+            r = await client.get(f"{url}/traffic-stats", timeout=5)
+            snap = r.json()
+            snap["t"] = round(time.perf_counter() - t0, 2)
+            samples.append(snap)
+        except Exception as e:
+            print("[WARN] /traffic-stats:", repr(e))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=every)
+        except asyncio.TimeoutError:
+            pass
+
+async def replay(events: List[Dict], url: str, speed: float | None, concurrency: int, poll: float, drain: float):
+    url = url.rstrip("/")
+    post_ms: List[float] = []
+    errors = 0
+    lag_ms: List[float] = []
+    sem = asyncio.Semaphore(concurrency)
+    samples: List[Dict] = []
+    stop = asyncio.Event()
+
+    async with httpx.AsyncClient(timeout=30) as client:
+        try:
+            await client.get(f"{url}/traffic-stats", params={"reset_peak": True}, timeout=5)
+        except Exception as e:
+            print("[WARN] No se pudo leer /traffic-stats:", repr(e))
+        poller = asyncio.create_task(_poll_stats(client, url, samples, stop, poll))
+
+        async def _send(ev: Dict, due: float):
+            nonlocal errors
+            async with sem:
+                lag_ms.append(max(0.0, (time.perf_counter() - due) * 1000))
+                t1 = time.perf_counter()
+                try:
+                    r = await client.post(f"{url}/webhook", json=ev["body"])
+                    if r.status_code >= 400:
+                        errors += 1
+                except Exception:
+                    errors += 1
+                post_ms.append((time.perf_counter() - t1) * 1000)
+
+        start = time.perf_counter()
+        first_ts = events[0]["ts"]
+        tasks = []
+        for ev in events:
+            due = start
+            if speed is not None:
+                due = start + (ev["ts"] - first_ts) / speed
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(_send(ev, due)))
+        await asyncio.gather(*tasks)
+        sent_secs = time.perf_counter() - start
+
+        # Espera a que la cola se vacíe (o hasta `drain` segundos)
+        deadline = time.perf_counter() + drain
+        while time.perf_counter() < deadline:
+            if samples and samples[-1].get("inflight", 0) == 0 and samples[-1]["t"] > sent_secs:
+                break
+            await asyncio.sleep(poll)
+        stop.set()
+        await poller
+
+    depth = [s.get("inflight", 0) for s in samples]
+    final = samples[-1] if samples else {}
+    return {
+        "events": len(events),
+        "speed": "max" if speed is None else speed,
+        "recording_secs": round(events[-1]["ts"] - first_ts, 2),
+        "send_secs": round(sent_secs, 2),
+        "post_errors": errors,
+        "post_latency_ms": {"p50": _pct(post_ms, 0.5), "p95": _pct(post_ms, 0.95), "p99": _pct(post_ms, 0.99)},
+        "schedule_lag_ms": {"p95": _pct(lag_ms, 0.95), "max": round(max(lag_ms), 1) if lag_ms else None},
+        "queue_depth": {"max_sampled": max(depth) if depth else None,
+                        "peak": final.get("peak_inflight"),
+                        "timeline": [(s["t"], s.get("inflight")) for s in samples]},
+        "processing_latency_ms": final.get("latency_ms"),
+    }
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("paths", nargs="+", help="Archivos .jsonl.gz o directorios de grabación")
+    parser.add_argument("--url", type=str, default="http://localhost:8080")
+    parser.add_argument("--speed", type=_speed, default=1.0, help="Factor de tiempo (1, 10, ...) o 'max'")
+    parser.add_argument("--concurrency", type=int, default=256, help="Máximo de POST simultáneos")
+    parser.add_argument("--poll", type=float, default=0.5, help="Intervalo de muestreo de /traffic-stats (s)")
+    parser.add_argument("--drain", type=float, default=120.0, help="Espera máxima para vaciar la cola (s)")
+    args = parser.parse_args()
+
+    events = collect_events(args.paths)
+    if not events:
+        print("[INFO] No hay eventos para repetir.")
+        return
+    print(f"[INFO] Repitiendo {len(events)} eventos a velocidad {args.speed or 'max'} contra {args.url} ...")
+    report = await replay(events, args.url, args.speed, args.concurrency, args.poll, args.drain)
+    timeline = report["queue_depth"].pop("timeline")
+    print(report)
+    print("[INFO] Profundidad de cola (t, en curso):", timeline)
+
+if __name__ == "__main__":
+    asyncio.run(main())
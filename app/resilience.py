@@ -0,0 +1,201 @@
+# app/resilience.py
+"""
+Circuit breakers y peticiones "hedged" para las dependencias externas
+(Hugging Face, Chroma y Groq).
+
+- Cada dependencia tiene un CircuitBreaker: si en la ventana reciente la tasa de
+  errores (contando como error las llamadas más lentas que `slow_ms`) supera
+  `failure_rate`, se abre durante `open_secs` y las llamadas fallan al instante
+  con CircuitOpenError; luego deja pasar una sola llamada de prueba (half_open).
+- Para llamadas idempotentes (embeddings y búsquedas) `guarded(..., hedge=True)`
+  lanza un duplicado si la primera no respondió tras el p95 observado.
+
+Cada breaker corre sus llamadas en un pool de hilos propio (BREAKER_MAX_THREADS):
+una llamada abandonada por timeout sigue ocupando su hilo hasta que termina, y así
+no agota el executor por defecto que usan las demás dependencias.
+
+Configuración por entorno: BREAKER_<NOMBRE>_TIMEOUT, BREAKER_<NOMBRE>_SLOW_MS
+(p. ej. BREAKER_HF_EMBED_TIMEOUT=15), BREAKER_FAILURE_RATE, BREAKER_OPEN_SECS,
+BREAKER_MAX_THREADS.
+"""
+
+import os, time, asyncio, functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+class CircuitOpenError(RuntimeError):
+    """La dependencia está marcada como caída; se usa la ruta degradada."""
+
+def _env_float(key: str, default: float) -> float:
+    try:
+        return float(os.getenv(key, "") or default)
+    except ValueError:
+        return default
+
+class CircuitBreaker:
+    def __init__(self, name: str, timeout: float, slow_ms: float, failure_rate: float = 0.5,
+                 window: int = 20, min_calls: int = 5, open_secs: float = 30.0,
+                 hedge_min_ms: float = 150.0):
+        self.name = name
+        self.timeout = timeout
+        self.slow_ms = slow_ms
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_secs = open_secs
+        self.hedge_min_ms = hedge_min_ms
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe = False
+        self._calls = deque(maxlen=window)     # True = fallo (error o lenta)
+        self._ok_lat = deque(maxlen=200)       # latencias de llamadas exitosas
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(_env_float("BREAKER_MAX_THREADS", 8)), thread_name_prefix=f"breaker-{name}"
+        )
+        self.stats = {"calls": 0, "failures": 0, "rejected": 0, "hedged": 0, "hedge_wins": 0, "opened": 0}
+
+    def allow(self) -> bool:
+        if self.state == "open":
+            if time.monotonic() - self.opened_at < self.open_secs:
+                self.stats["rejected"] += 1
+                return False
+            self.state = "half_open"
+            self._probe = False
+        if self.state == "half_open":
+            if self._probe:
+                self.stats["rejected"] += 1
+                return False
+            self._probe = True
+        return True
+
+    def record(self, ok: bool, latency_ms: float):
+        failed = (not ok) or latency_ms > self.slow_ms
+        self.stats["calls"] += 1
+        if not ok:
+            self.stats["failures"] += 1
+        else:
+            self._ok_lat.append(latency_ms)
+        if self.state == "half_open":
+            self._probe = False
+            if failed:
+                self._open()
+            else:
+                self.state = "closed"
+                self._calls.clear()
+            return
+        self._calls.append(failed)
+        if len(self._calls) >= self.min_calls and sum(self._calls) / len(self._calls) >= self.failure_rate:
+            self._open()
+
+    def release(self):
+        """La llamada se canceló sin resultado: libera la prueba de half_open sin contarla."""
+        if self.state == "half_open":
+            self._probe = False
+
+    def _open(self):
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self.stats["opened"] += 1
+        print(f"BREAKER_OPEN: {self.name}")
+
+    def p95_ms(self) -> float | None:
+        if len(self._ok_lat) < 5:
+            return None
+        lat = sorted(self._ok_lat)
+        return lat[min(len(lat) - 1, int(0.95 * len(lat)))]
+
+    def hedge_delay(self) -> float:
+        p95 = self.p95_ms()
+        return max(self.hedge_min_ms, p95 if p95 is not None else 1000.0) / 1000
+
+    def snapshot(self) -> Dict[str, Any]:
+        calls = list(self._calls)
+        return {
+            "state": self.state,
+            "error_rate": round(sum(calls) / len(calls), 2) if calls else 0.0,
+            "p95_ms": round(self.p95_ms(), 1) if self.p95_ms() is not None else None,
+            "timeout_s": self.timeout,
+            "slow_ms": self.slow_ms,
+            "open_for_s": round(max(0.0, self.open_secs - (time.monotonic() - self.opened_at)), 1)
+                          if self.state == "open" else 0.0,
+            **self.stats,
+        }
+
+def _make(name: str, timeout: float, slow_ms: float) -> CircuitBreaker:
+    key = name.upper()
+    return CircuitBreaker(
+        name,
+        timeout=_env_float(f"BREAKER_{key}_TIMEOUT", timeout),
+        slow_ms=_env_float(f"BREAKER_{key}_SLOW_MS", slow_ms),
+        failure_rate=_env_float("BREAKER_FAILURE_RATE", 0.5),
+        open_secs=_env_float("BREAKER_OPEN_SECS", 30.0),
+    )
+
+BREAKERS: Dict[str, CircuitBreaker] = {
+    "hf_embed": _make("hf_embed", timeout=15.0, slow_ms=5000.0),
+    "chroma": _make("chroma", timeout=10.0, slow_ms=3000.0),
+    "groq": _make("groq", timeout=30.0, slow_ms=15000.0),
+    # Lotes de /ask/batch: umbrales más amplios y sin compartir estado con el tráfico en vivo
+    "hf_embed_batch": _make("hf_embed_batch", timeout=60.0, slow_ms=30000.0),
+    "chroma_batch": _make("chroma_batch", timeout=30.0, slow_ms=15000.0),
+}
+
+def _submit(br: CircuitBreaker, fn: Callable, args, kwargs) -> asyncio.Future:
+    return asyncio.get_running_loop().run_in_executor(br.executor, functools.partial(fn, *args, **kwargs))
+
+def breaker_states() -> Dict[str, Dict[str, Any]]:
+    return {name: br.snapshot() for name, br in BREAKERS.items()}
+
+async def _hedged(br: CircuitBreaker, fn: Callable, args, kwargs):
+    """Primera respuesta exitosa entre la llamada original y un duplicado tardío."""
+    deadline = time.monotonic() + br.timeout
+    delay = br.hedge_delay()
+    if delay >= br.timeout:
+        return await asyncio.wait_for(_submit(br, fn, args, kwargs), br.timeout)
+    first = _submit(br, fn, args, kwargs)
+    done, _ = await asyncio.wait({first}, timeout=delay)
+    if done:
+        return first.result()
+    br.stats["hedged"] += 1
+    second = _submit(br, fn, args, kwargs)
+    pending = {first, second}
+    error: BaseException | None = None
+    while pending:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            if t.exception() is None:
+                if t is second:
+                    br.stats["hedge_wins"] += 1
+                for p in pending:
+                    p.cancel()
+                return t.result()
+            error = t.exception()
+    for p in pending:
+        p.cancel()
+    raise error or asyncio.TimeoutError(f"{br.name}: sin respuesta en {br.timeout}s")
+
+async def guarded(name: str, fn: Callable, *args, hedge: bool = False, **kwargs):
+    """
+    Ejecuta `fn` (síncrona) en el pool del breaker, con su timeout.
+    Lanza CircuitOpenError sin llamar a la dependencia si el breaker está abierto.
+    """
+    br = BREAKERS[name]
+    if not br.allow():
+        raise CircuitOpenError(f"{name}: circuito abierto")
+    t0 = time.perf_counter()
+    try:
+        if hedge:
+            result = await _hedged(br, fn, args, kwargs)
+        else:
+            result = await asyncio.wait_for(_submit(br, fn, args, kwargs), br.timeout)
+    except asyncio.CancelledError:
+        br.release()
+        raise
+    except Exception:
+        br.record(False, (time.perf_counter() - t0) * 1000)
+        raise
+    br.record(True, (time.perf_counter() - t0) * 1000)
+    return result
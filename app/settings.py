@@ -1,5 +1,8 @@
 # app/settings.py
-from pydantic import BaseSettings
+try:
+    from pydantic_settings import BaseSettings  # pydantic 2.x
+except ImportError:
+    from pydantic import BaseSettings  # pydantic 1.x
 from functools import lru_cache
 import os
 
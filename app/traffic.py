@@ -0,0 +1,205 @@
+# app/traffic.py
+"""
+Grabación de tráfico del webhook y métricas de la cola de procesamiento.
+
+- TrafficRecorder: guarda eventos sanitizados (teléfonos e ids `wamid.*` con hash
+  salado, sin nombres) en archivos JSONL.gz rotativos, con la marca de tiempo de llegada.
+  Si no hay WEBHOOK_RECORD_SALT se genera una sal aleatoria y se guarda en `<dir>/.salt`.
+- QueueStats: cuenta tareas en curso y latencias recientes de process_and_reply,
+  para observar el comportamiento bajo carga (ver app/replay_webhook.py).
+
+Se activa con WEBHOOK_RECORD_DIR (por defecto desactivado).
+"""
+
+import os, gzip, json, time, hashlib, secrets, threading
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Los números con este prefijo vienen de una repetición: no se envían a WhatsApp ni se graban.
+REPLAY_PREFIX = "replay-"
+
+_PHONE_KEYS = {"from", "wa_id", "to", "recipient_id"}
+
+def hash_phone(number: str, salt: str = "") -> str:
+    digest = hashlib.sha256(f"{salt}{number}".encode("utf-8")).hexdigest()
+    return f"{REPLAY_PREFIX}{digest[:16]}"
+
+def hash_message_id(wamid: str, salt: str = "") -> str:
+    # Los ids de WhatsApp (wamid.<base64>) contienen el número del remitente
+    digest = hashlib.sha256(f"{salt}{wamid}".encode("utf-8")).hexdigest()
+    return f"wamid.{REPLAY_PREFIX}{digest[:24]}"
+
+def sanitize_event(body: Any, salt: str = "") -> Any:
+    """Copia del evento con teléfonos e ids de mensaje reemplazados por hash y nombres de perfil vaciados."""
+    if isinstance(body, dict):
+        out = {}
+        for k, v in body.items():
+            if k in _PHONE_KEYS and isinstance(v, str) and v:
+                out[k] = hash_phone(v, salt)
+            elif isinstance(v, str) and v.startswith("wamid."):
+                out[k] = hash_message_id(v, salt)
+            elif k == "profile" and isinstance(v, dict):
+                out[k] = {**sanitize_event(v, salt), "name": ""} if "name" in v else sanitize_event(v, salt)
+            else:
+                out[k] = sanitize_event(v, salt)
+        return out
+    if isinstance(body, list):
+        return [sanitize_event(x, salt) for x in body]
+    if isinstance(body, str) and body.startswith("wamid."):
+        return hash_message_id(body, salt)
+    return body
+
+def _load_or_create_salt(directory: Path) -> str:
+    """Sal persistente por directorio de grabación (sin sal, el hash de un teléfono se revierte por fuerza bruta)."""
+    path = directory / ".salt"
+    if path.exists():
+        salt = path.read_text(encoding="utf-8").strip()
+        if salt:
+            return salt
+    salt = secrets.token_hex(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w", encoding="utf-8") as fh:
+        fh.write(salt)
+    print(f"RECORDER: sal aleatoria creada en {path}")
+    return salt
+
+def is_replayed(body: Any) -> bool:
+    try:
+        msgs = body["entry"][0]["changes"][0]["value"].get("messages", [])
+        return bool(msgs) and str(msgs[0].get("from", "")).startswith(REPLAY_PREFIX)
+    except Exception:
+        return False
+
+class TrafficRecorder:
+    """
+    Escribe eventos en `<dir>/webhook-<fecha>.jsonl.gz`.
+    record() solo agrega al buffer en memoria; un hilo aparte lo vuelca cada
+    `flush_secs` segundos o al juntar `flush_every` eventos, así la compresión y la
+    escritura no corren en el event loop. Cada volcado es un miembro gzip independiente,
+    así el archivo siempre es legible. Rota cuando el archivo supera `max_bytes`.
+    """
+
+    def __init__(self, directory: str, salt: str = "", max_bytes: int = 50 * 1024 * 1024,
+                 flush_every: int = 50, flush_secs: float = 5.0):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.salt = salt or _load_or_create_salt(self.dir)
+        self.max_bytes = max_bytes
+        self.flush_every = flush_every
+        self.flush_secs = flush_secs
+        self._buf: List[str] = []
+        self._lock = threading.Lock()      # protege el buffer
+        self._io_lock = threading.Lock()   # serializa las escrituras al archivo
+        self._path = self._new_path()
+        self._wake = threading.Event()
+        self._halt = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="traffic-recorder", daemon=True)
+        self._thread.start()
+
+    def _new_path(self) -> Path:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = self.dir / f"webhook-{stamp}.jsonl.gz"
+        n = 1
+        while path.exists():
+            path = self.dir / f"webhook-{stamp}-{n}.jsonl.gz"
+            n += 1
+        return path
+
+    def record(self, body: Any, ts: Optional[float] = None):
+        if is_replayed(body):
+            return
+        line = json.dumps({"ts": ts if ts is not None else time.time(),
+                           "body": sanitize_event(body, self.salt)}, ensure_ascii=False)
+        with self._lock:
+            self._buf.append(line)
+            full = len(self._buf) >= self.flush_every
+        if full:
+            self._wake.set()
+
+    def _run(self):
+        while not self._halt.is_set():
+            self._wake.wait(self.flush_secs)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            lines, self._buf = self._buf, []
+        if not lines:
+            return
+        data = ("\n".join(lines) + "\n").encode("utf-8")
+        with self._io_lock:
+            try:
+                with open(self._path, "ab") as fh:
+                    fh.write(gzip.compress(data))
+                if self._path.stat().st_size >= self.max_bytes:
+                    self._path = self._new_path()
+            except Exception as e:
+                print("RECORDER_ERROR:", repr(e))
+
+    def close(self):
+        """Detiene el hilo de volcado y escribe lo que quede en el buffer."""
+        self._halt.set()
+        self._wake.set()
+        self._thread.join(timeout=5)
+        self.flush()
+
+def read_recording(path: Path) -> List[Dict]:
+    """Lee un archivo JSONL.gz grabado (admite varios miembros gzip)."""
+    events = []
+    with gzip.open(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if line:
+                events.append(json.loads(line))
+    return events
+
+def get_recorder() -> Optional[TrafficRecorder]:
+    directory = os.getenv("WEBHOOK_RECORD_DIR", "").strip()
+    if not directory:
+        return None
+    return TrafficRecorder(
+        directory,
+        salt=os.getenv("WEBHOOK_RECORD_SALT", ""),
+        max_bytes=int(float(os.getenv("WEBHOOK_RECORD_MAX_MB", "50")) * 1024 * 1024),
+    )
+
+class QueueStats:
+    """Tareas de respuesta en curso y latencias recientes (ventana de `window`)."""
+
+    def __init__(self, window: int = 500):
+        self.inflight = 0
+        self.peak = 0
+        self.completed = 0
+        self.errors = 0
+        self._lat = deque(maxlen=window)
+
+    def start(self) -> float:
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        return time.perf_counter()
+
+    def done(self, t0: float, ok: bool = True):
+        self.inflight -= 1
+        self.completed += 1
+        if not ok:
+            self.errors += 1
+        self._lat.append((time.perf_counter() - t0) * 1000)
+
+    def snapshot(self) -> Dict:
+        lat = sorted(self._lat)
+
+        def pct(p: float):
+            return round(lat[min(len(lat) - 1, int(p * len(lat)))], 1) if lat else None
+
+        return {
+            "inflight": self.inflight,
+            "peak_inflight": self.peak,
+            "completed": self.completed,
+            "errors": self.errors,
+            "latency_ms": {"p50": pct(0.50), "p95": pct(0.95), "p99": pct(0.99), "n": len(lat)},
+        }
+
+    def reset_peak(self):
+        self.peak = self.inflight
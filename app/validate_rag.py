@@ -1,8 +1,54 @@
 # validate_rag.py
-import asyncio
-from app.rag import answer_with_rag
+"""
+Prueba de RAG desde consola.
 
-async def main():
+Uso:
+  python -m app.validate_rag                         # modo interactivo
+  python -m app.validate_rag --batch preguntas.txt   # una pregunta por línea (o CSV)
+  python -m app.validate_rag --batch faq.csv --out resultados.ndjson --concurrency 4
+"""
+import argparse, asyncio, csv, json, sys
+from collections import Counter
+from pathlib import Path
+from typing import List
+from app.rag import answer_with_rag, answer_batch
+
+def load_questions(path: Path) -> List[str]:
+    """Lee preguntas de .txt (una por línea) o .csv (columna 'pregunta'/'question' o la primera)."""
+    raw = path.read_text(encoding="utf-8-sig", errors="ignore")
+    if path.suffix.lower() != ".csv":
+        return [line.strip() for line in raw.splitlines() if line.strip()]
+    rows = list(csv.reader(raw.splitlines()))
+    if not rows:
+        return []
+    header = [h.strip().lower() for h in rows[0]]
+    for name in ("pregunta", "question"):
+        if name in header:
+            col = header.index(name)
+            return [r[col].strip() for r in rows[1:] if len(r) > col and r[col].strip()]
+    return [r[0].strip() for r in rows if r and r[0].strip()]
+
+async def run_batch(path: Path, out: Path | None, k: int, concurrency: int):
+    questions = load_questions(path)
+    if not questions:
+        print(f"[INFO] No se hallaron preguntas en {path}", file=sys.stderr)
+        return
+    print(f"[INFO] {len(questions)} preguntas, concurrencia={concurrency}", file=sys.stderr)
+    fh = out.open("w", encoding="utf-8") if out else sys.stdout
+    degraded = Counter()
+    try:
+        async for item in answer_batch(questions, k=k, concurrency=concurrency):
+            fh.write(json.dumps(item, ensure_ascii=False) + "\n")
+            fh.flush()
+            if item.get("degraded"):
+                degraded[item["degraded"]] += 1
+    finally:
+        if out:
+            fh.close()
+    if degraded:
+        print(f"[WARN] respuestas degradadas: {dict(degraded)} de {len(questions)}", file=sys.stderr)
+
+async def interactive():
     print("🔍 Prueba de RAG para Cámara de Comercio de Pamplona\n")
     while True:
         question = input("Pregunta (o 'salir'): ")
@@ -14,5 +60,18 @@ async def main():
         print(ans)
         print("\n---")
 
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--batch", type=str, default=None, help="Archivo .txt/.csv con preguntas")
+    parser.add_argument("--out", type=str, default=None, help="Salida NDJSON (por defecto stdout)")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    if args.batch:
+        await run_batch(Path(args.batch), Path(args.out) if args.out else None, args.k, args.concurrency)
+    else:
+        await interactive()
+
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,178 @@
+# bench/microbench.py
+"""
+Microbenchmarks de las funciones que corren en cada mensaje o en cada chunk.
+
+Fixtures realistas:
+- texto de los PDF de knowledge/ccp (vía load_documents y la caché de extracción);
+- salidas de Hugging Face feature-extraction con las formas que devuelve
+  all-MiniLM-L6-v2 (dim=384): [dim], [seq, dim] y [[seq, dim], ...];
+- un evento real de WhatsApp Cloud API (bench/fixtures/webhook_text.json).
+
+Uso:
+  python -m bench.microbench                                  # mide y muestra
+  python -m bench.microbench --save bench/baseline.json       # guarda línea base
+  python -m bench.microbench --compare bench/baseline.json    # falla (exit 1) si algo empeora
+  python -m bench.microbench --filter pool --threshold 0.15
+
+Las líneas base dependen de la máquina: compáralas solo en el mismo entorno.
+Una regresión debe superar --threshold más la dispersión mínimo–mediana de la línea
+base, y se vuelve a medir (--retries) antes de fallar.
+"""
+
+from __future__ import annotations
+import sys, json, time, random, timeit, argparse, platform
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+FIXTURES = Path(__file__).parent / "fixtures"
+KNOWLEDGE_DIR = Path("knowledge/ccp")
+EMBED_DIM = 384      # all-MiniLM-L6-v2
+SEQ_LEN = 48         # tokens de una pregunta típica de WhatsApp
+BATCH = 8
+
+# ----------------------------
+# Fixtures
+# ----------------------------
+
+def _corpus() -> Tuple[str, List[Tuple[str, Dict]]]:
+    """(texto crudo de una página, items normalizados del corpus)."""
+    from ingest.ingest_ccp import load_documents, pdf_cache, HAS_PYPDF
+    if not HAS_PYPDF:
+        raise RuntimeError("pypdf es necesario para los fixtures de texto.")
+    from pypdf import PdfReader
+    raw = PdfReader(str(KNOWLEDGE_DIR / "Camara_Comercio_Pamplona_Informe_RAG.pdf")).pages[0].extract_text()
+    items = load_documents(KNOWLEDGE_DIR, cache=pdf_cache(".cache/extract"))
+    return raw, items
+
+def _hf_outputs() -> Dict[str, list]:
+    rnd = random.Random(1234)
+
+    def vec():
+        return [rnd.uniform(-0.2, 0.2) for _ in range(EMBED_DIM)]
+
+    return {
+        "pooled": vec(),                                              # [dim]
+        "tokens": [vec() for _ in range(SEQ_LEN)],                    # [seq, dim]
+        "batch": [[vec() for _ in range(SEQ_LEN)] for _ in range(BATCH)],  # [[seq, dim], ...]
+    }
+
+def build_benchmarks() -> Dict[str, Callable[[], object]]:
+    from ingest.ingest_ccp import normalize_text, word_chunks, build_chunks, _mean_pool as ingest_mean_pool
+    from app.providers import _mean_pool as providers_mean_pool, cosine_sim
+    from app.rag import _mean_pool as rag_mean_pool, _build_prompt
+    from app.main import parse_webhook
+
+    raw_page, items = _corpus()
+    page = max((t for t, _ in items), key=len)
+    hf = _hf_outputs()
+    a, b = hf["tokens"][0], hf["tokens"][1]
+    chunks = [c for c in word_chunks(" ".join(t for t, _ in items), 420, 80)[:5]]
+    question = "¿Hasta cuándo tengo plazo para renovar la matrícula mercantil y qué documentos necesito?"
+    raw_event = (FIXTURES / "webhook_text.json").read_bytes()
+    event = json.loads(raw_event)
+
+    return {
+        "normalize_text": lambda: normalize_text(raw_page),
+        "word_chunks": lambda: word_chunks(page, 420, 80),
+        "build_chunks": lambda: build_chunks(items, 420, 80),
+        "providers._mean_pool[seq,dim]": lambda: providers_mean_pool(hf["tokens"]),
+        "providers._mean_pool[batch]": lambda: providers_mean_pool(hf["batch"]),
+        "rag._mean_pool[seq,dim]": lambda: rag_mean_pool(hf["tokens"]),
+        "rag._mean_pool[batch]": lambda: rag_mean_pool(hf["batch"]),
+        "ingest._mean_pool[seq,dim]": lambda: ingest_mean_pool(hf["tokens"]),
+        "ingest._mean_pool[batch]": lambda: ingest_mean_pool(hf["batch"]),
+        "cosine_sim": lambda: cosine_sim(a, b),
+        "_build_prompt": lambda: _build_prompt(question, chunks),
+        "webhook.parse": lambda: parse_webhook(json.loads(raw_event)),
+        "webhook.log_dump": lambda: json.dumps(event, ensure_ascii=False),
+    }
+
+# ----------------------------
+# Medición y comparación
+# ----------------------------
+
+def measure(fn: Callable[[], object], repeat: int, min_secs: float) -> Dict[str, float]:
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    if elapsed < min_secs:
+        number = max(1, int(number * min_secs / max(elapsed, 1e-9)))
+    runs = sorted(t / number for t in timer.repeat(repeat=repeat, number=number))
+    return {"min_us": round(runs[0] * 1e6, 3), "median_us": round(runs[len(runs) // 2] * 1e6, 3), "number": number}
+
+def _regressed(res: Dict, base: Dict, threshold: float) -> bool:
+    """Empeoró más que `threshold` más el ruido propio de la línea base (mediana/mínimo)."""
+    spread = base.get("median_us", base["min_us"]) / max(base["min_us"], 1e-9) - 1
+    return res["min_us"] / max(base["min_us"], 1e-9) > 1 + threshold + spread
+
+def recheck(benches: Dict[str, Callable], results: Dict[str, Dict], baseline: Dict[str, Dict],
+            threshold: float, retries: int, repeat: int, min_secs: float):
+    """Vuelve a medir lo que parece una regresión y se queda con el mejor mínimo: un solo pase ruidoso no falla."""
+    for _ in range(retries):
+        flagged = [n for n, r in results.items() if n in baseline and _regressed(r, baseline[n], threshold)]
+        if not flagged:
+            return
+        for name in flagged:
+            again = measure(benches[name], repeat, min_secs)
+            if again["min_us"] < results[name]["min_us"]:
+                results[name] = again
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    regressions = []
+    print(f"{'benchmark':<32}{'base µs':>12}{'ahora µs':>12}{'cambio':>10}")
+    for name, res in results.items():
+        base = baseline.get(name)
+        if not base:
+            print(f"{name:<32}{'-':>12}{res['min_us']:>12.2f}{'nuevo':>10}")
+            continue
+        ratio = res["min_us"] / max(base["min_us"], 1e-9)
+        flag = ""
+        if _regressed(res, base, threshold):
+            flag = "  ← REGRESIÓN"
+            regressions.append(name)
+        print(f"{name:<32}{base['min_us']:>12.2f}{res['min_us']:>12.2f}{(ratio - 1) * 100:>9.1f}%{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--filter", type=str, default="", help="Solo benchmarks cuyo nombre contenga este texto")
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--min-secs", type=float, default=0.2, help="Tiempo mínimo por repetición")
+    parser.add_argument("--save", type=str, default=None, help="Guarda los resultados como línea base")
+    parser.add_argument("--compare", type=str, default=None, help="Línea base con la que comparar")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Empeoramiento tolerado además del ruido de la línea base (0.25 = 25%%)")
+    parser.add_argument("--retries", type=int, default=2, help="Nuevas mediciones de una posible regresión")
+    args = parser.parse_args()
+
+    benches = {k: v for k, v in build_benchmarks().items() if args.filter in k}
+    results: Dict[str, Dict] = {}
+    for name, fn in benches.items():
+        results[name] = measure(fn, args.repeat, args.min_secs)
+        if not args.compare:
+            r = results[name]
+            print(f"{name:<32}{r['min_us']:>12.2f} µs  (mediana {r['median_us']:.2f}, n={r['number']})")
+
+    if args.save:
+        doc = {
+            "meta": {"python": platform.python_version(), "machine": platform.machine(),
+                     "platform": platform.platform(), "created": time.strftime("%Y-%m-%dT%H:%M:%S")},
+            "results": results,
+        }
+        Path(args.save).write_text(json.dumps(doc, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[OK] Línea base guardada en {args.save}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        meta = baseline.get("meta", {})
+        if meta.get("python") != platform.python_version():
+            print(f"[WARN] Línea base con Python {meta.get('python')}, ahora {platform.python_version()}")
+        base_results = baseline.get("results", {})
+        recheck(benches, results, base_results, args.threshold, args.retries, args.repeat, args.min_secs)
+        regressions = compare(results, base_results, args.threshold)
+        if regressions:
+            print(f"[FAIL] {len(regressions)} regresiones > {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+        print("[OK] Sin regresiones.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+# ingest/bench_chunking.py
+"""
+Barrido de parámetros de chunking: calidad de recuperación vs. costo.
+
+Para cada combinación de --sizes × --overlaps × --strategies construye los chunks
+con build_chunks, los indexa en memoria con embeddings locales y responde un
+set de preguntas etiquetadas. Reporta por configuración:
+  chunks, bytes del índice, tiempo de ingesta, latencia de recuperación,
+  recall@k y tokens promedio del prompt (aprox. por palabras, como word_chunks).
+Con --workers > 1 cada proceso usa un solo hilo de torch; los tiempos son comparables
+entre configuraciones de una misma corrida, no con la ingesta real.
+
+Embeddings (sin red):
+- st: sentence-transformers local (si está instalado)
+- hash: vectores por hashing de palabras y bigramas (sin dependencias)
+
+Set etiquetado (JSONL): {"question": "...", "expected": ["frase que debe aparecer", ...]}
+Una pregunta cuenta como acierto si algún chunk del top-k contiene alguna frase
+esperada (sin distinguir mayúsculas ni tildes).
+
+Uso:
+  python -m ingest.bench_chunking --questions knowledge/eval/preguntas_ccp.jsonl
+  python -m ingest.bench_chunking --sizes 200,420,600 --overlaps 0,80 --strategies words,sentences --workers 4 --out sweep.json
+"""
+
+from __future__ import annotations
+import os, re, json, math, time, zlib, argparse, unicodedata
+from concurrent.futures import ProcessPoolExecutor
+from itertools import product
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from ingest.ingest_ccp import load_documents, build_chunks, pdf_cache, embed_local, HAS_ST, CHUNKERS
+
+# ----------------------------
+# Embeddings locales
+# ----------------------------
+
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+def embed_hashing(texts: List[str], dim: int = 512) -> List[List[float]]:
+    """Bolsa de palabras + bigramas proyectada con hashing (crc32), tf sublineal y norma L2."""
+    out: List[List[float]] = []
+    for text in texts:
+        toks = re.findall(r"\w+", _fold(text))
+        counts: Dict[int, float] = {}
+        for feat in toks + [f"{a} {b}" for a, b in zip(toks, toks[1:])]:
+            h = zlib.crc32(feat.encode("utf-8"))
+            idx = h % dim
+            counts[idx] = counts.get(idx, 0.0) + (1.0 if (h >> 31) & 1 else -1.0)
+        vec = [0.0] * dim
+        for i, c in counts.items():
+            vec[i] = math.copysign(1.0 + math.log(abs(c)), c) if c else 0.0
+        norm = math.sqrt(sum(x * x for x in vec)) or 1.0
+        out.append([x / norm for x in vec])
+    return out
+
+def embed(texts: List[str], embedder: str, model: str) -> List[List[float]]:
+    if embedder == "st":
+        return embed_local(texts, model)
+    return embed_hashing(texts)
+
+def top_k(qvec: List[float], index: List[List[float]], k: int) -> List[int]:
+    # Vectores normalizados: el producto punto es el coseno
+    scores = [sum(a * b for a, b in zip(qvec, v)) for v in index]
+    return sorted(range(len(scores)), key=scores.__getitem__, reverse=True)[:k]
+
+# ----------------------------
+# Evaluación de una configuración
+# ----------------------------
+
+_ITEMS: List[Tuple[str, Dict]] = []
+_QUESTIONS: List[Dict] = []
+
+def _init_worker(items, questions, single_thread: bool = False):
+    global _ITEMS, _QUESTIONS
+    _ITEMS, _QUESTIONS = items, questions
+    if single_thread:
+        # Con varios procesos, torch abriría un hilo por núcleo en cada uno y la latencia
+        # de recuperación mediría la contención entre workers, no la búsqueda.
+        os.environ["TOKENIZERS_PARALLELISM"] = "false"
+        try:
+            import torch
+            torch.set_num_threads(1)
+        except ImportError:
+            pass
+
+def _pct(values: List[float], p: float) -> float:
+    v = sorted(values)
+    return v[min(len(v) - 1, int(p * len(v)))] if v else 0.0
+
+def evaluate(cfg: Dict) -> Dict:
+    from app.rag import _build_prompt  # el mismo prompt que usa producción
+
+    size, overlap, strategy, k = cfg["size"], cfg["overlap"], cfg["strategy"], cfg["k"]
+    t0 = time.perf_counter()
+    docs, metas, _ = build_chunks(_ITEMS, chunk_size=size, chunk_overlap=overlap, strategy=strategy)
+    chunk_secs = time.perf_counter() - t0
+    vecs = embed(docs, cfg["embedder"], cfg["model"])
+    ingest_secs = time.perf_counter() - t0
+
+    dim = len(vecs[0]) if vecs else 0
+    index_bytes = (len(vecs) * dim * 4                                  # float32 como en Chroma
+                   + sum(len(d.encode("utf-8")) for d in docs)
+                   + sum(len(json.dumps(m, ensure_ascii=False).encode("utf-8")) for m in metas))
+
+    folded = [_fold(d) for d in docs]
+    hits, lat_ms, prompt_tokens = 0, [], []
+    for q in _QUESTIONS:
+        t1 = time.perf_counter()
+        qvec = embed([q["question"]], cfg["embedder"], cfg["model"])[0]
+        ids = top_k(qvec, vecs, k)
+        lat_ms.append((time.perf_counter() - t1) * 1000)
+        expected = [_fold(e) for e in q.get("expected", [])]
+        if any(e in folded[i] for i in ids for e in expected):
+            hits += 1
+        prompt_tokens.append(len(_build_prompt(q["question"], [docs[i] for i in ids]).split()))
+
+    n = len(_QUESTIONS) or 1
+    return {
+        "strategy": strategy,
+        "size": size,
+        "overlap": overlap,
+        "chunks": len(docs),
+        "index_bytes": index_bytes,
+        "chunk_secs": round(chunk_secs, 3),
+        "ingest_secs": round(ingest_secs, 3),
+        "retrieval_ms_avg": round(sum(lat_ms) / n, 2),
+        "retrieval_ms_p95": round(_pct(lat_ms, 0.95), 2),
+        f"recall@{k}": round(hits / n, 3),
+        "prompt_tokens_avg": round(sum(prompt_tokens) / n, 1),
+    }
+
+# ----------------------------
+# CLI
+# ----------------------------
+
+def load_questions(path: Path) -> List[Dict]:
+    out = []
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line and not line.startswith("#"):
+            out.append(json.loads(line))
+    return out
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dir", type=str, default="knowledge/ccp")
+    parser.add_argument("--questions", type=str, default="knowledge/eval/preguntas_ccp.jsonl")
+    parser.add_argument("--sizes", type=str, default="200,300,420,600")
+    parser.add_argument("--overlaps", type=str, default="0,40,80")
+    parser.add_argument("--strategies", type=str, default=",".join(sorted(CHUNKERS)))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--embedder", type=str, default="st" if HAS_ST else "hash", choices=["st", "hash"])
+    parser.add_argument("--model", type=str, default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-dir", type=str, default=".cache/extract")
+    parser.add_argument("--out", type=str, default=None, help="Guarda los resultados (.json)")
+    args = parser.parse_args()
+
+    items = load_documents(Path(args.dir), cache=pdf_cache(args.cache_dir))
+    questions = load_questions(Path(args.questions))
+    if not items or not questions:
+        print("[INFO] Faltan documentos o preguntas etiquetadas.")
+        return
+
+    configs = [
+        {"size": size, "overlap": ov, "strategy": st, "k": args.k, "embedder": args.embedder, "model": args.model}
+        for st, size, ov in product(args.strategies.split(","), _ints(args.sizes), _ints(args.overlaps))
+        if ov < size
+    ]
+    print(f"[INFO] {len(configs)} configuraciones, {len(questions)} preguntas, "
+          f"embedder={args.embedder}, workers={args.workers}")
+
+    t0 = time.perf_counter()
+    if args.workers > 1:
+        with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                 initargs=(items, questions, True)) as pool:
+            results = list(pool.map(evaluate, configs))
+    else:
+        _init_worker(items, questions)
+        results = [evaluate(c) for c in configs]
+
+    recall_key = f"recall@{args.k}"
+    results.sort(key=lambda r: (-r[recall_key], r["prompt_tokens_avg"]))
+    cols = ["strategy", "size", "overlap", "chunks", "index_bytes", "ingest_secs",
+            "retrieval_ms_avg", recall_key, "prompt_tokens_avg"]
+    print("  ".join(f"{c:>16}" for c in cols))
+    for r in results:
+        print("  ".join(f"{r[c]:>16}" for c in cols))
+    print(f"[OK] Barrido completo en {time.perf_counter() - t0:.1f}s")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"[OK] Resultados en {args.out}")
+
+if __name__ == "__main__":
+    main()
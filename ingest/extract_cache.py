@@ -0,0 +1,88 @@
+# ingest/extract_cache.py
+"""
+Caché persistente de extracción de texto (PDF) para la ingesta.
+
+Cada archivo se identifica por el hash SHA-256 de su contenido y la versión del
+parser; la entrada guarda el texto normalizado por página y sus metadatos en
+un JSONL.gz (primera línea: cabecera con el tiempo que tomó el parseo original).
+Cambiar el PDF, actualizar pypdf o subir EXTRACT_VERSION invalida la entrada.
+"""
+
+from __future__ import annotations
+import os, gzip, json, time, hashlib
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Súbelo al cambiar normalize_text o la forma de extraer páginas.
+EXTRACT_VERSION = 1
+
+def file_sha256(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class ExtractionCache:
+    def __init__(self, directory: str | Path, parser_tag: str):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.parser_tag = f"{parser_tag}-v{EXTRACT_VERSION}"
+        self.hits = 0
+        self.misses = 0
+        self.saved_secs = 0.0
+        self.parse_secs = 0.0
+
+    def _entry(self, digest: str) -> Path:
+        return self.dir / f"{digest[:32]}-{self.parser_tag}.jsonl.gz"
+
+    def read_through(self, path: Path, reader: Callable[[Path], List[Tuple[str, Dict]]]) -> List[Tuple[str, Dict]]:
+        """Devuelve los items de `path` desde la caché o ejecuta `reader` y guarda el resultado."""
+        digest = file_sha256(path)
+        entry = self._entry(digest)
+        t0 = time.perf_counter()
+        if entry.exists():
+            try:
+                items, header = self._load(entry)
+                self.hits += 1
+                self.saved_secs += max(0.0, header.get("parse_secs", 0.0) - (time.perf_counter() - t0))
+                # La ruta puede haber cambiado aunque el contenido sea el mismo
+                for _, md in items:
+                    md.update({"source": path.name, "source_path": str(path), "title": path.stem})
+                return items
+            except Exception as e:
+                print(f"[WARN] Entrada de caché corrupta {entry.name}: {e}")
+
+        self.misses += 1
+        items = reader(path)
+        parse_secs = time.perf_counter() - t0
+        self.parse_secs += parse_secs
+        self._store(entry, items, {"sha256": digest, "parser": self.parser_tag,
+                                   "pages": len(items), "parse_secs": round(parse_secs, 3)})
+        return items
+
+    @staticmethod
+    def _load(entry: Path) -> Tuple[List[Tuple[str, Dict]], Dict]:
+        with gzip.open(entry, "rt", encoding="utf-8") as fh:
+            header = json.loads(fh.readline())
+            items = [(row["text"], row["md"]) for row in map(json.loads, fh) if row]
+        return items, header
+
+    @staticmethod
+    def _store(entry: Path, items: List[Tuple[str, Dict]], header: Dict):
+        tmp = entry.with_suffix(".tmp")
+        try:
+            with gzip.open(tmp, "wt", encoding="utf-8") as fh:
+                fh.write(json.dumps(header, ensure_ascii=False) + "\n")
+                for text, md in items:
+                    fh.write(json.dumps({"text": text, "md": md}, ensure_ascii=False) + "\n")
+            os.replace(tmp, entry)
+        except Exception as e:
+            print(f"[WARN] No se pudo escribir la caché {entry.name}: {e}")
+            tmp.unlink(missing_ok=True)
+
+    def report(self) -> str:
+        total = self.hits + self.misses
+        rate = (100.0 * self.hits / total) if total else 0.0
+        return (f"[CACHE] extracción {self.parser_tag}: {self.hits}/{total} aciertos ({rate:.0f}%), "
+                f"ahorro ~{self.saved_secs:.1f}s, parseo nuevo {self.parse_secs:.1f}s")
@@ -8,12 +8,23 @@ Backends de embeddings:
 - local: sentence-transformers (requiere CPU/RAM local)
 
 Uso:
-  python -m ingest.ingest_ccp --dir knowledge/ccp --backend hf --reset
+  python -m ingest.ingest_ccp --dir knowledge/ccp --backend hf
   python -m ingest.ingest_ccp --dir knowledge/ccp --backend local --chunk-size 420 --chunk-overlap 80
+  python -m ingest.ingest_ccp --versions          # lista versiones del índice
+  python -m ingest.ingest_ccp --rollback          # vuelve a la versión anterior
+  python -m ingest.ingest_ccp --in-place --reset  # modo antiguo: reescribe la colección activa
+
+Cada ingesta crea una colección versionada nueva, la valida (conteo y consulta de
+prueba) y solo entonces cambia el puntero de la versión activa; producción nunca
+ve un índice vacío o parcial. Se conservan --keep versiones anteriores.
+
+El texto extraído de los PDF se guarda en --cache-dir (por hash de contenido y
+versión de pypdf), así los siguientes runs no vuelven a parsear el corpus.
 """
 
 from __future__ import annotations
 import os, re, html, argparse
+from functools import lru_cache
 from pathlib import Path
 from typing import List, Tuple, Dict
 
@@ -28,6 +39,7 @@ except Exception:
     HAS_BS4 = False
 
 try:
+    import pypdf
     from pypdf import PdfReader
     HAS_PYPDF = True
 except Exception:
@@ -41,7 +53,11 @@ except Exception:
     HAS_ST = False
 
 # Chroma client y settings
-from app.chroma_client import get_collection
+from app.chroma_client import (
+    get_collection, new_version_name, create_version, drop_version, swap_active, rollback,
+    read_pointer, INDEX_KEEP_VERSIONS,
+)
+from ingest.extract_cache import ExtractionCache
 try:
     from app.settings import get_settings  # si tu proyecto lo tiene
     _HAS_SETTINGS = True
@@ -76,6 +92,48 @@ def word_chunks(text: str, chunk_size: int = 400, chunk_overlap: int = 80) -> Li
         out.append(" ".join(slice_words))
     return out
 
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+def sentence_chunks(text: str, chunk_size: int = 400, chunk_overlap: int = 80) -> List[str]:
+    """
+    Agrupa oraciones completas hasta ~chunk_size palabras; el solape repite
+    las últimas oraciones (hasta chunk_overlap palabras) en el siguiente chunk.
+    Las oraciones más largas que chunk_size se cortan con word_chunks.
+    """
+    # Con solape >= chunk_size el chunk nunca se vaciaría y cada oración lo repetiría entero.
+    chunk_overlap = max(0, min(chunk_overlap, chunk_size - 1))
+    sentences: List[List[str]] = []
+    for sent in _SENTENCE_RE.split(text):
+        words = sent.split()
+        if len(words) > chunk_size:
+            sentences.extend(w.split() for w in word_chunks(sent, chunk_size, chunk_overlap))
+        elif words:
+            sentences.append(words)
+    out: List[str] = []
+    cur: List[List[str]] = []
+    n = 0
+    for words in sentences:
+        if cur and n + len(words) > chunk_size:
+            out.append(" ".join(w for s in cur for w in s))
+            keep: List[List[str]] = []
+            kept = 0
+            for s in reversed(cur):
+                if kept + len(s) > chunk_overlap:
+                    break
+                keep.insert(0, s)
+                kept += len(s)
+            cur, n = keep, kept
+        cur.append(words)
+        n += len(words)
+    if cur:
+        out.append(" ".join(w for s in cur for w in s))
+    return out
+
+CHUNKERS = {
+    "words": word_chunks,
+    "sentences": sentence_chunks,
+}
+
 # ----------------------------
 # Lectores
 # ----------------------------
@@ -132,7 +190,13 @@ READERS = {
     ".htm":  read_html,
 }
 
-def load_documents(root_dir: Path) -> List[Tuple[str, Dict]]:
+def pdf_cache(cache_dir: str | Path | None) -> ExtractionCache | None:
+    """Caché de extracción para PDF (None si está desactivada o no hay pypdf)."""
+    if not cache_dir or not HAS_PYPDF:
+        return None
+    return ExtractionCache(cache_dir, parser_tag=f"pypdf-{getattr(pypdf, '__version__', 'unknown')}")
+
+def load_documents(root_dir: Path, cache: ExtractionCache | None = None) -> List[Tuple[str, Dict]]:
     items: List[Tuple[str, Dict]] = []
     if not root_dir.exists():
         print(f"[WARN] No existe el directorio: {root_dir}")
@@ -140,15 +204,46 @@ def load_documents(root_dir: Path) -> List[Tuple[str, Dict]]:
     for ext, reader in READERS.items():
         for f in root_dir.rglob(f"*{ext}"):
             try:
-                items.extend(reader(f))
+                if cache is not None and ext == ".pdf":
+                    items.extend(cache.read_through(f, reader))
+                else:
+                    items.extend(reader(f))
             except Exception as e:
                 print(f"[WARN] No se pudo leer {f}: {e}")
+    if cache is not None:
+        print(cache.report())
     return items
 
 # ----------------------------
 # Embeddings
 # ----------------------------
 
+def _mean_pool(v):
+    # Casos:
+    # - Un texto → [[seq, dim]] OR [dim]
+    # - Varios textos → [[[seq, dim]], ...]
+    if not isinstance(v, list) or not v:
+        raise RuntimeError("Formato de embeddings inesperado (no lista).")
+
+    # [dim]
+    if v and all(isinstance(x, (int, float)) for x in v):
+        return v
+
+    # [seq, dim]
+    if v and isinstance(v[0], list) and all(isinstance(x, (int, float)) for x in v[0]):
+        seq = len(v); dim = len(v[0])
+        return [sum(v[t][d] for t in range(seq)) / max(seq, 1) for d in range(dim)]
+
+    # [[seq, dim], ...]
+    pooled = []
+    for row in v:
+        if row and isinstance(row[0], list) and all(isinstance(x, (int, float)) for x in row[0]):
+            seq = len(row); dim = len(row[0])
+            pooled.append([sum(row[t][d] for t in range(seq)) / max(seq, 1) for d in range(dim)])
+        else:
+            raise RuntimeError("Formato de embeddings inesperado (sub-lista).")
+    return pooled  # ojo: en llamada externa manejamos este caso
+
 async def embed_hf(texts: List[str], model: str, hf_token: str) -> List[List[float]]:
     """
     Hugging Face Inference API (feature-extraction).
@@ -168,33 +263,7 @@ async def embed_hf(texts: List[str], model: str, hf_token: str) -> List[List[flo
         r.raise_for_status()
         data = r.json()
 
-    def mean_pool(v):
-        # Casos:
-        # - Un texto → [[seq, dim]] OR [dim]
-        # - Varios textos → [[[seq, dim]], ...]
-        if not isinstance(v, list) or not v:
-            raise RuntimeError("Formato de embeddings inesperado (no lista).")
-
-        # [dim]
-        if v and all(isinstance(x, (int, float)) for x in v):
-            return v
-
-        # [seq, dim]
-        if v and isinstance(v[0], list) and all(isinstance(x, (int, float)) for x in v[0]):
-            seq = len(v); dim = len(v[0])
-            return [sum(v[t][d] for t in range(seq)) / max(seq, 1) for d in range(dim)]
-
-        # [[seq, dim], ...]
-        pooled = []
-        for row in v:
-            if row and isinstance(row[0], list) and all(isinstance(x, (int, float)) for x in row[0]):
-                seq = len(row); dim = len(row[0])
-                pooled.append([sum(row[t][d] for t in range(seq)) / max(seq, 1) for d in range(dim)])
-            else:
-                raise RuntimeError("Formato de embeddings inesperado (sub-lista).")
-        return pooled  # ojo: en llamada externa manejamos este caso
-
-    pooled = mean_pool(data)
+    pooled = _mean_pool(data)
     # Normalizamos a lista de vectores
     if pooled and isinstance(pooled[0], list) and all(isinstance(x, (int, float)) for x in pooled[0]):
         # ya es [dim] (1 texto) → [[dim]]
@@ -204,11 +273,15 @@ async def embed_hf(texts: List[str], model: str, hf_token: str) -> List[List[flo
         return pooled
     raise RuntimeError("No se pudo normalizar embeddings (estructura desconocida).")
 
+@lru_cache(maxsize=2)
+def _st_model(model_name: str):
+    return SentenceTransformer(model_name)
+
 def embed_local(texts: List[str], model_name: str) -> List[List[float]]:
     if not HAS_ST:
         raise RuntimeError("sentence-transformers no está instalado (backend local no disponible).")
-    model = SentenceTransformer(model_name)
-    vecs = model.encode(texts, show_progress_bar=True, normalize_embeddings=True)
+    model = _st_model(model_name)
+    vecs = model.encode(texts, show_progress_bar=len(texts) > 32, normalize_embeddings=True)
     return vecs.tolist()
 
 async def compute_embeddings(texts: List[str], backend: str, model: str, hf_token: str | None) -> List[List[float]]:
@@ -223,13 +296,15 @@ async def compute_embeddings(texts: List[str], backend: str, model: str, hf_toke
 # Pipeline principal
 # ----------------------------
 
-def build_chunks(items: List[Tuple[str, Dict]], chunk_size: int, chunk_overlap: int) -> Tuple[List[str], List[Dict], List[str]]:
+def build_chunks(items: List[Tuple[str, Dict]], chunk_size: int, chunk_overlap: int,
+                 strategy: str = "words") -> Tuple[List[str], List[Dict], List[str]]:
+    chunker = CHUNKERS[strategy]
     docs: List[str] = []
     metas: List[Dict] = []
     ids: List[str] = []
     idx = 0
     for text, base_md in items:
-        chunks = word_chunks(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        chunks = chunker(text, chunk_size=chunk_size, chunk_overlap=chunk_overlap)
         for ch in chunks:
             md = dict(base_md)
             md["chunk_size"] = len(ch.split())
@@ -239,6 +314,41 @@ def build_chunks(items: List[Tuple[str, Dict]], chunk_size: int, chunk_overlap:
             idx += 1
     return docs, metas, ids
 
+def upsert(coll, docs: List[str], metas: List[Dict], ids: List[str], embs: List[List[float]]):
+    try:
+        coll.add(documents=docs, metadatas=metas, ids=ids, embeddings=embs)
+    except Exception as e:
+        print(f"[WARN] Falló add(): {e}. Intentando delete+add por lotes ...")
+        B = 512
+        for i in range(0, len(ids), B):
+            sub_ids = ids[i:i+B]
+            try:
+                coll.delete(ids=sub_ids)
+            except Exception:
+                pass
+            coll.add(
+                documents=docs[i:i+B],
+                metadatas=metas[i:i+B],
+                ids=sub_ids,
+                embeddings=embs[i:i+B],
+            )
+
+def validate_version(coll, ids: List[str], embs: List[List[float]]) -> str | None:
+    """Conteo esperado y consulta de prueba: cada chunk muestreado debe recuperarse a sí mismo."""
+    count = coll.count()
+    if count != len(ids):
+        return f"count={count}, esperado={len(ids)}"
+    probes = sorted({0, len(ids) // 2, len(ids) - 1})
+    res = coll.query(query_embeddings=[embs[i] for i in probes], n_results=1, include=["distances"])
+    for j, i in enumerate(probes):
+        got = (res.get("ids") or [[]])[j]
+        dist = (res.get("distances") or [[]])[j]
+        if not got:
+            return f"consulta de prueba sin resultados para {ids[i]}"
+        if got[0] != ids[i] and not (dist and dist[0] < 1e-4):
+            return f"consulta de prueba: {ids[i]} devolvió {got[0]}"
+    return None
+
 def _get_env_settings():
     """Fallback si no existe app.settings.get_settings()."""
     class S:
@@ -253,8 +363,26 @@ async def main():
     parser.add_argument("--model", type=str, default=None, help="Modelo de embeddings (opcional)")
     parser.add_argument("--chunk-size", type=int, default=420)
     parser.add_argument("--chunk-overlap", type=int, default=80)
-    parser.add_argument("--reset", action="store_true", help="Borra documentos previos en la colección")
+    parser.add_argument("--chunk-strategy", type=str, default="words", choices=sorted(CHUNKERS),
+                        help="words: ventana de palabras; sentences: respeta oraciones")
+    parser.add_argument("--reset", action="store_true",
+                        help="Con --in-place: borra documentos previos (el modo versionado siempre parte de cero)")
+    parser.add_argument("--in-place", action="store_true", help="Escribe en la colección activa, sin versionar")
+    parser.add_argument("--keep", type=int, default=INDEX_KEEP_VERSIONS, help="Versiones anteriores a conservar")
+    parser.add_argument("--versions", action="store_true", help="Muestra la versión activa y el historial")
+    parser.add_argument("--rollback", action="store_true", help="Activa la versión anterior")
+    parser.add_argument("--cache-dir", type=str, default=".cache/extract", help="Caché de texto extraído de PDF")
+    parser.add_argument("--no-cache", action="store_true", help="Parsea todos los PDF sin usar la caché")
     args = parser.parse_args()
+    if args.chunk_size < 1 or not 0 <= args.chunk_overlap < args.chunk_size:
+        parser.error("--chunk-overlap debe estar entre 0 y --chunk-size - 1")
+
+    if args.versions:
+        print(read_pointer())
+        return
+    if args.rollback:
+        print(rollback())
+        return
 
     s = get_settings() if _HAS_SETTINGS else _get_env_settings()
     root = Path(args.dir)
@@ -264,12 +392,13 @@ async def main():
     model = args.model or getattr(s, "hf_embed_model", None) or "sentence-transformers/all-MiniLM-L6-v2"
 
     # Carga documentos
-    items = load_documents(root)
+    items = load_documents(root, cache=None if args.no_cache else pdf_cache(args.cache_dir))
     if not items:
         print(f"[INFO] No se hallaron documentos en {root.resolve()}")
         return
 
-    docs, metas, ids = build_chunks(items, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    docs, metas, ids = build_chunks(items, chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap,
+                                    strategy=args.chunk_strategy)
     if not docs:
         print("[INFO] No se generaron chunks.")
         return
@@ -279,32 +408,32 @@ async def main():
     embs = await compute_embeddings(docs, backend=args.backend, model=model, hf_token=hf_token)
 
     # Chroma
-    coll = get_collection()
-    if args.reset:
+    if args.in_place:
+        coll = get_collection()
+        if args.reset:
+            try:
+                coll.delete(where={})  # limpiar colección completa
+                print("[WARN] Colección limpiada (reset).")
+            except Exception as e:
+                print(f"[WARN] No se pudo limpiar: {e}")
+        upsert(coll, docs, metas, ids, embs)
+    else:
+        coll = create_version(new_version_name())
+        print(f"[INFO] Construyendo versión '{coll.name}' ...")
         try:
-            coll.delete(where={})  # limpiar colección completa
-            print("[WARN] Colección limpiada (reset).")
+            upsert(coll, docs, metas, ids, embs)
+            problem = validate_version(coll, ids, embs)
         except Exception as e:
-            print(f"[WARN] No se pudo limpiar: {e}")
-
-    # upsert
-    try:
-        coll.add(documents=docs, metadatas=metas, ids=ids, embeddings=embs)
-    except Exception as e:
-        print(f"[WARN] Falló add(): {e}. Intentando delete+add por lotes ...")
-        B = 512
-        for i in range(0, len(ids), B):
-            sub_ids = ids[i:i+B]
+            problem = repr(e)
+        if problem:
+            print(f"[ERROR] Validación fallida ({problem}); se descarta '{coll.name}' y no se cambia la versión activa.")
             try:
-                coll.delete(ids=sub_ids)
-            except Exception:
-                pass
-            coll.add(
-                documents=docs[i:i+B],
-                metadatas=metas[i:i+B],
-                ids=sub_ids,
-                embeddings=embs[i:i+B],
-            )
+                drop_version(coll.name)
+            except Exception as e:
+                print(f"[WARN] No se pudo borrar {coll.name}: {e}")
+            raise SystemExit(1)
+        info = swap_active(coll.name, keep=args.keep)
+        print(f"[OK] Versión activa: {info['active']} (anteriores: {info['history'][1:]}, borradas: {info['dropped']})")
 
     print(f"[OK] Ingesta completa: {len(docs)} chunks → colección '{coll.name}'.")
     report = {